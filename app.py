@@ -1,36 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
+from flask import (Flask, Response, abort, current_app, get_template_attribute, render_template, request,
+                   redirect, url_for, flash, jsonify, send_from_directory)
 from models import db, Card, Listing, Order
+import metrics
+import chunked_upload
+import condition_results
+import events
+import read_models
+import render_cache
+import storage
+import tenants
 from datetime import datetime, timedelta
 from dateutil import tz
-from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-import anthropic
-import base64
+import click
 import os
-import cv2
-import numpy as np
-from PIL import Image
-import json
-import time
 
 load_dotenv()
 
-SETTINGS_FILE = os.path.join(os.path.dirname(__file__), 'settings.json')
-
 
 def load_settings():
-    """Load settings from JSON file."""
-    try:
-        with open(SETTINGS_FILE, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return get_default_settings()
+    """Load the current tenant's settings (cached until the file changes)."""
+    with metrics.timed('settings_read'):
+        settings = tenants.current().load_settings()
+    return settings if settings is not None else get_default_settings()
 
 
 def save_settings(settings):
-    """Save settings to JSON file."""
-    with open(SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f, indent=4)
+    """Save the current tenant's settings."""
+    tenants.current().save_settings(settings)
+    render_cache.invalidate()
 
 
 def get_default_settings():
@@ -79,64 +77,66 @@ def get_recommended_shipping(sale_price):
     else:
         return options[0]  # Economy
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ebaysales.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
-
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tif', 'tiff'}
 
-db.init_app(app)
+# View functions are collected here and registered on each app by create_app()
+ROUTES = []
 
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def route(rule, **options):
+    """Register a view function to be added to the app in create_app()."""
+    def decorator(func):
+        ROUTES.append((rule, func, options))
+        return func
+    return decorator
 
 
-def auto_crop_card(filepath):
+def create_app(config=None):
     """
-    Crop a trading card scan to fixed dimensions.
-    Assumes card in penny sleeve is flush to top-left corner at 600 DPI.
+    Application factory.
 
-    Card: 2.5" x 3.5" = 1500 x 2100 pixels at 600 DPI
-    Penny sleeve adds: 3mm left, 3mm right, 5mm top, 3mm bottom
-    At 600 DPI: 1mm = 23.62 pixels
+    Heavy dependencies (OpenCV, the Anthropic SDK) are imported by the routes
+    that need them, and the schema is created by `flask --app app init-db`
+    rather than at import time.
     """
-    # Read image with OpenCV
-    img = cv2.imread(filepath)
-    if img is None:
-        return filepath
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.urandom(24)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///ebaysales.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'uploads'))
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+    app.config['GRADING_LOCAL'] = os.getenv('GRADING_LOCAL') == '1'  # Batch grading via grading_local.py
+    app.config['LIVE_EVENTS'] = False  # /events streams; serve.py turns this on (see events.py)
+    if config:
+        app.config.update(config)
 
-    # Dimensions at 600 DPI
-    mm_to_px = 600 / 25.4  # ~23.62 pixels per mm
+    db.init_app(app)
+    tenants.init_app(app)
+    metrics.init_app(app)
 
-    card_width = int(2.5 * 600)   # 1500px
-    card_height = int(3.5 * 600)  # 2100px
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view.__name__, view, **options)
 
-    sleeve_left = int(3 * mm_to_px)    # ~71px
-    sleeve_right = int(3 * mm_to_px)   # ~71px
-    sleeve_top = int(5 * mm_to_px)     # ~118px
-    sleeve_bottom = int(3 * mm_to_px)  # ~71px
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create database tables and the uploads folder."""
+        init_db(app)
+        click.echo('Initialized the database.')
 
-    cushion = 5  # 5px extra border
+    return app
 
-    # Total crop dimensions (sleeved card + cushion on right/bottom only since flush to corner)
-    crop_width = sleeve_left + card_width + sleeve_right + cushion
-    crop_height = sleeve_top + card_height + sleeve_bottom + cushion
 
-    # Make sure we don't exceed image bounds
-    crop_width = min(crop_width, img.shape[1])
-    crop_height = min(crop_height, img.shape[0])
+def init_db(app):
+    """Create every tenant's tables and uploads folder (safe to run repeatedly)."""
+    for tenant in tenants.registry(app).all():
+        with tenants.use_tenant(app, tenant.name):
+            tenants.create_tables(tenant)
+        os.makedirs(tenant.upload_folder, exist_ok=True)
 
-    # Crop from top-left corner
-    cropped = img[0:crop_height, 0:crop_width]
 
-    # Save the cropped image
-    cv2.imwrite(filepath, cropped)
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    return filepath
 
 # Timezone for Saturday 11pm target
 EASTERN = tz.gettz('America/New_York')
@@ -165,30 +165,110 @@ def get_next_saturday_11pm():
 
 def get_status_counts():
     """Get counts of listings in each status for the dashboard."""
-    counts = {}
-    for status in ['draft', 'scheduled', 'listed', 'ended_sold', 'paid', 'shipped']:
-        counts[status] = Listing.query.filter_by(status=status).count()
-    return counts
+    return read_models.status_counts()
+
+
+def publish_listing(listing_id):
+    """
+    Tell live dashboards a listing changed (call after commit): its row as
+    now rendered (None once deleted or off the dashboard), and new counts.
+    """
+    if not events.broker.subscriber_count():
+        return
+    listing = db.session.get(Listing, listing_id)
+    row = None
+    if listing is not None and listing.status in read_models.DASHBOARD_STATUSES:
+        row = str(get_template_attribute('dashboard_row.html', 'listing_row')(listing))
+    events.publish('listing', {
+        'listing_id': listing_id,
+        'status': listing.status if listing is not None else None,
+        'row': row,
+        'counts': read_models.status_counts(),
+        'dashboard': dashboard_etag(),
+    })
+
+
+def store_upload(src_path, original_name):
+    """
+    Run the scan quality gate, then move the scan into the content-addressed
+    store, correcting and auto-cropping it the first time those bytes are
+    seen. Returns (filename, filepath, quality) where filename is the store
+    path saved on the card and quality holds the gate's measurements.
+    Rejected scans are deleted and imaging.ScanRejected is raised.
+    """
+    from imaging import ScanRejected, auto_crop_card, check_scan
+
+    try:
+        quality, plan = check_scan(src_path)
+    except ScanRejected:
+        os.remove(src_path)
+        raise
+
+    upload_folder = tenants.upload_folder()
+    ext = original_name.rsplit('.', 1)[1].lower()
+    stored = storage.store_file(upload_folder, src_path, ext, process=lambda path: auto_crop_card(path, plan))
+    events.publish('upload', {'filename': stored.path, 'corrections': quality['corrections']})
+    return stored.path, os.path.join(upload_folder, stored.path), quality
+
+
+def scan_rejected_response(error):
+    """JSON error for a scan that failed the quality gate."""
+    return jsonify({'error': f'Scan rejected: {error}', 'quality': error.quality}), 422
 
 
-@app.route('/uploads/<filename>')
+def save_upload(file):
+    """Save a Werkzeug upload to a temporary file and store it."""
+    tmp_path = storage.incoming_path(tenants.upload_folder(), 'upload')
+    file.save(tmp_path)
+    return store_upload(tmp_path, file.filename)
+
+
+@route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """Serve uploaded images."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Not the in-progress uploads under .incoming/ and .partial/
+    if filename.split('/', 1)[0].startswith('.'):
+        abort(404)
+    return send_from_directory(tenants.upload_folder(), filename)
+
+
+def dashboard_token():
+    """(next_end_time, change token, last_modified) of the dashboard page."""
+    next_end_time = get_next_saturday_11pm()
+    token, last_modified = render_cache.dashboard_version()
+    # The next end time moves a day when the 120-hour window passes 11pm
+    last_modified = max(filter(None, (last_modified, next_end_time - timedelta(days=6))))
+    token = (token, next_end_time.isoformat(), current_app.config['LIVE_EVENTS'])
+    return next_end_time, token, last_modified
 
 
-@app.route('/')
+def dashboard_etag():
+    """ETag of the dashboard as it would be rendered now."""
+    return render_cache.etag('index', dashboard_token()[1])
+
+
+@route('/')
 def index():
     """Dashboard showing overview and action items."""
-    counts = get_status_counts()
+    next_end_time, token, last_modified = dashboard_token()
+    etag = render_cache.etag('index', token)
+    return render_cache.cached_page('index', token, last_modified,
+                                    lambda: render_dashboard(next_end_time, etag))
 
-    # Items needing action
-    drafts = Listing.query.filter_by(status='draft').all()
-    sold_unpaid = Listing.query.filter_by(status='ended_sold').all()
-    paid_unshipped = Listing.query.filter_by(status='paid').all()
-    active = Listing.query.filter_by(status='listed').all()
 
-    next_end_time = get_next_saturday_11pm()
+def render_dashboard(next_end_time, etag):
+    """
+    Render the dashboard HTML. Only called when the change token is new.
+    The page keeps its ETag to tell whether it missed live updates.
+    """
+    counts = read_models.status_counts()
+
+    # Items needing action
+    listings = read_models.listings_by_status()
+    drafts = listings['draft']
+    sold_unpaid = listings['ended_sold']
+    paid_unshipped = listings['paid']
+    active = listings['listed']
 
     return render_template('index.html',
                            counts=counts,
@@ -196,17 +276,19 @@ def index():
                            sold_unpaid=sold_unpaid,
                            paid_unshipped=paid_unshipped,
                            active=active,
-                           next_end_time=next_end_time)
+                           next_end_time=next_end_time,
+                           etag=etag,
+                           live_events=current_app.config['LIVE_EVENTS'])
 
 
-@app.route('/cards')
+@route('/cards')
 def list_cards():
     """List all cards."""
-    cards = Card.query.order_by(Card.created_at.desc()).all()
+    cards = read_models.card_rows()
     return render_template('cards.html', cards=cards)
 
 
-@app.route('/cards/add', methods=['GET', 'POST'])
+@route('/cards/add', methods=['GET', 'POST'])
 def add_card():
     """Add a new card."""
     if request.method == 'POST':
@@ -238,6 +320,10 @@ def add_card():
             card.condition = request.form['condition']
 
         db.session.add(card)
+        storage.add_reference(card.image_front)
+        storage.add_reference(card.image_back)
+        db.session.flush()
+        condition_results.link_card(card)
         db.session.commit()
 
         # Automatically create a draft listing
@@ -248,6 +334,7 @@ def add_card():
         )
         db.session.add(listing)
         db.session.commit()
+        publish_listing(listing.id)
 
         flash(f'Card added: {card.title()}', 'success')
         return redirect(url_for('list_cards'))
@@ -255,7 +342,7 @@ def add_card():
     return render_template('add_card.html')
 
 
-@app.route('/cards/<int:card_id>/edit', methods=['GET', 'POST'])
+@route('/cards/<int:card_id>/edit', methods=['GET', 'POST'])
 def edit_card(card_id):
     """Edit an existing card."""
     card = Card.query.get_or_404(card_id)
@@ -276,8 +363,10 @@ def edit_card(card_id):
 
         # Only update images if new ones are provided
         if request.form.get('image_front'):
+            storage.replace_reference(card.image_front, request.form.get('image_front'))
             card.image_front = request.form.get('image_front')
         if request.form.get('image_back'):
+            storage.replace_reference(card.image_back, request.form.get('image_back'))
             card.image_back = request.form.get('image_back')
 
         if card.is_graded:
@@ -287,14 +376,20 @@ def edit_card(card_id):
         else:
             card.condition = request.form['condition']
 
+        if card.listing:
+            card.listing.updated_at = datetime.utcnow()  # Listing pages render the card
+        db.session.flush()
+        condition_results.link_card(card)
         db.session.commit()
+        if card.listing:
+            publish_listing(card.listing.id)
         flash(f'Card updated: {card.title()}', 'success')
         return redirect(url_for('list_cards'))
 
     return render_template('edit_card.html', card=card)
 
 
-@app.route('/listings/<int:listing_id>/status', methods=['POST'])
+@route('/listings/<int:listing_id>/status', methods=['POST'])
 def update_listing_status(listing_id):
     """Manually update a listing's status."""
     listing = Listing.query.get_or_404(listing_id)
@@ -313,22 +408,24 @@ def update_listing_status(listing_id):
             listing.order.shipped_at = datetime.utcnow()
 
     db.session.commit()
+    publish_listing(listing.id)
     flash(f'Listing status updated to: {new_status}', 'success')
     return redirect(url_for('index'))
 
 
-@app.route('/report')
+@route('/report')
 def daily_report():
     """Generate daily action report."""
     today = datetime.now(EASTERN).date()
 
+    listings = read_models.listings_by_status()
     report = {
         'generated_at': datetime.now(EASTERN),
-        'drafts_ready': Listing.query.filter_by(status='draft').count(),
-        'active_auctions': Listing.query.filter_by(status='listed').all(),
-        'awaiting_payment': Listing.query.filter_by(status='ended_sold').all(),
-        'needs_shipping': Listing.query.filter_by(status='paid').all(),
-        'recently_shipped': Listing.query.filter_by(status='shipped').all(),
+        'drafts_ready': len(listings['draft']),
+        'active_auctions': listings['listed'],
+        'awaiting_payment': listings['ended_sold'],
+        'needs_shipping': listings['paid'],
+        'recently_shipped': listings['shipped'],
     }
 
     # Calculate totals
@@ -339,9 +436,19 @@ def daily_report():
     return render_template('report.html', report=report)
 
 
-@app.route('/listings/<int:listing_id>/preview')
+@route('/listings/<int:listing_id>/preview')
 def preview_listing(listing_id):
     """Preview auction details before posting."""
+    version = render_cache.listing_version(listing_id)
+    if version is None:
+        abort(404)
+    token, last_modified = version
+    return render_cache.cached_page('preview_listing', token, last_modified,
+                                    lambda: render_preview(listing_id))
+
+
+def render_preview(listing_id):
+    """Render the preview HTML (on a render cache miss)."""
     listing = Listing.query.get_or_404(listing_id)
     card = listing.card
 
@@ -358,7 +465,7 @@ def preview_listing(listing_id):
                            recommended_shipping=recommended_shipping)
 
 
-@app.route('/cards/<int:card_id>/delete', methods=['POST'])
+@route('/cards/<int:card_id>/delete', methods=['POST'])
 def delete_card(card_id):
     """Delete a card and its listing."""
     card = Card.query.get_or_404(card_id)
@@ -368,45 +475,134 @@ def delete_card(card_id):
         flash('Cannot delete card with active or completed listing', 'error')
         return redirect(url_for('list_cards'))
 
+    listing_id = card.listing.id if card.listing else None
     if card.listing:
         db.session.delete(card.listing)
 
+    storage.release_reference(card.image_front)
+    storage.release_reference(card.image_back)
     db.session.delete(card)
     db.session.commit()
+    if listing_id is not None:
+        publish_listing(listing_id)
     flash('Card deleted', 'success')
     return redirect(url_for('list_cards'))
 
 
-@app.route('/api/upload-image', methods=['POST'])
+@route('/api/upload-image', methods=['POST'])
 def upload_image():
     """Handle image upload without condition check."""
     if 'image' not in request.files:
         return jsonify({'error': 'No image provided'}), 400
 
     file = request.files['image']
-    side = request.form.get('side', 'front')  # 'front' or 'back'
 
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{side}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        from imaging import ScanRejected
 
-        # Auto-crop the card from the scan
-        auto_crop_card(filepath)
+        try:
+            filename, filepath, quality = save_upload(file)
+        except ScanRejected as e:
+            return scan_rejected_response(e)
 
         return jsonify({
             'success': True,
             'filename': filename,
-            'filepath': filepath
+            'filepath': filepath,
+            'quality': quality
         })
 
     return jsonify({'error': 'Invalid file type'}), 400
 
 
-@app.route('/api/check-condition', methods=['POST'])
+@route('/api/upload-image/chunked', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable chunked upload for scans too large for one request."""
+    data = request.get_json(silent=True) or request.form
+    original_name = data.get('filename', '')
+    side = data.get('side', 'front')
+
+    if not original_name or not allowed_file(original_name):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    try:
+        length = int(data.get('length', 0))
+        state = chunked_upload.create_upload(tenants.upload_folder(), original_name, side,
+                                             length, data.get('checksum'))
+    except ValueError:
+        return jsonify({'error': 'Invalid upload length'}), 400
+    except chunked_upload.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    response = jsonify({
+        'upload_id': state['id'],
+        'offset': 0,
+        'length': length,
+        'chunk_size': chunked_upload.CHUNK_SIZE
+    })
+    response.status_code = 201
+    response.headers['Location'] = url_for('chunked_upload_status', upload_id=state['id'])
+    return response
+
+
+@route('/api/upload-image/chunked/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def chunked_upload_status(upload_id):
+    """
+    GET/HEAD: report the current offset so an interrupted upload can resume.
+    PATCH: append a chunk (raw body) at Upload-Offset. The last chunk
+    assembles the file and runs the auto-crop, like /api/upload-image.
+    DELETE: abandon the upload.
+    """
+    upload_folder = tenants.upload_folder()
+
+    try:
+        if request.method == 'DELETE':
+            chunked_upload.load_upload(upload_folder, upload_id)
+            chunked_upload.discard_upload(upload_folder, upload_id)
+            return '', 204
+
+        if request.method != 'PATCH':
+            state = chunked_upload.load_upload(upload_folder, upload_id)
+        else:
+            try:
+                offset = int(request.headers['Upload-Offset'])
+            except (KeyError, ValueError):
+                return jsonify({'error': 'Missing or invalid Upload-Offset header'}), 400
+            checksum = chunked_upload.parse_checksum_header(request.headers.get('Upload-Checksum'))
+            state = chunked_upload.write_chunk(upload_folder, upload_id, offset, request.stream, checksum)
+
+            if state['offset'] == state['length']:
+                from imaging import ScanRejected
+
+                part_path = chunked_upload.finish_upload(upload_folder, upload_id)
+                try:
+                    filename, filepath, quality = store_upload(part_path, state['filename'])
+                except ScanRejected as e:
+                    return scan_rejected_response(e)
+
+                return jsonify({
+                    'success': True,
+                    'filename': filename,
+                    'filepath': filepath,
+                    'quality': quality,
+                    'offset': state['offset'],
+                    'length': state['length']
+                })
+
+    except chunked_upload.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    response = jsonify({'offset': state['offset'], 'length': state['length']})
+    response.headers['Upload-Offset'] = str(state['offset'])
+    response.headers['Upload-Length'] = str(state['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@route('/api/check-condition', methods=['POST'])
 def check_condition():
     """Upload image and check condition using Claude API."""
     if 'image' not in request.files:
@@ -423,13 +619,14 @@ def check_condition():
     if not file or not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type'}), 400
 
-    # Save the file
-    filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{side}_{file.filename}")
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    from imaging import ScanRejected
 
-    # Auto-crop the card from the scan
-    auto_crop_card(filepath)
+    # Save the file (quality-checked, auto-cropped, deduplicated by content).
+    # Rejected scans never reach the model.
+    try:
+        filename, filepath, quality = save_upload(file)
+    except ScanRejected as e:
+        return scan_rejected_response(e)
 
     # Check if API key is configured
     api_key = os.getenv('ANTHROPIC_API_KEY')
@@ -438,107 +635,120 @@ def check_condition():
             'success': True,
             'filename': filename,
             'filepath': filepath,
+            'quality': quality,
             'condition_check': None,
             'warning': 'ANTHROPIC_API_KEY not configured. Image saved but condition not checked.'
         })
 
-    # Read and encode the image
-    with open(filepath, 'rb') as f:
-        image_data = base64.standard_b64encode(f.read()).decode('utf-8')
+    from grading import MAX_ATTEMPTS, check_card_condition
 
-    # Determine media type
-    ext = filename.rsplit('.', 1)[1].lower()
-    media_type = 'image/jpeg' if ext in ('jpg', 'jpeg') else f'image/{ext}'
-    if ext in ('tif', 'tiff'):
-        media_type = 'image/tiff'
-
-    # Build prompt based on card type
-    if card_type == 'sports':
-        condition_scale = "NM (Near Mint), EX (Excellent), VG (Very Good), G (Good), P (Poor)"
-    else:
-        condition_scale = "NM (Near Mint), LP (Lightly Played), MP (Moderately Played), HP (Heavily Played), DMG (Damaged)"
+    try:
+        result = check_card_condition(api_key, filepath, filename, card_type, side, selected_condition)
+    except Exception as e:
+        return jsonify({
+            'success': True,
+            'filename': filename,
+            'filepath': filepath,
+            'quality': quality,
+            'condition_check': None,
+            'error': f'Condition check failed after {MAX_ATTEMPTS} attempts: {str(e)}'
+        })
 
-    prompt = f"""Analyze this {card_type} trading card image ({side} of card) for condition assessment.
+    # Linked to the card when the Add/Edit Card form is saved
+    condition_results.save_result(result, filename, side, card_type)
+    db.session.commit()
+    events.publish('condition', {'side': side, 'estimated_grade': result['estimated_grade']})
 
-The seller has selected condition: {selected_condition if selected_condition else 'not yet selected'}
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'filepath': filepath,
+        'quality': quality,
+        'condition_check': condition_results.format_result(result),
+        'condition_result': result
+    })
 
-Using the standard condition scale for {card_type} cards: {condition_scale}
 
-Please assess:
-1. Corners - any whitening, dings, or wear?
-2. Edges - any whitening, chipping, or roughness?
-3. Surface - any scratches, print defects, staining, or creases?
-4. Centering - estimate the centering (e.g., 60/40, 55/45)
+@route('/api/condition-results/below-selected')
+def condition_results_below_selected():
+    """Cards whose AI-estimated grade is below the seller's selected condition."""
+    limit = request.args.get('limit', type=int)
+    return jsonify([
+        {
+            'card_id': card.id,
+            'title': card.title(),
+            'side': result.side,
+            'selected_condition': card.condition,
+            'estimated_grade': result.estimated_grade,
+            'grade_gap': result.grade_gap,
+            'centering': result.centering,
+        }
+        for card, result in condition_results.graded_below_selected(limit)
+    ])
 
-Then provide:
-- Your estimated condition grade
-- If the seller's selected condition seems accurate, too generous, or too conservative
-- Any specific issues a buyer might notice
 
-Be concise and direct. Focus on what matters for selling."""
+@route('/api/grade-batch', methods=['GET', 'POST'])
+def grade_batch():
+    """
+    Batch condition grading. POST collects finished batches and submits all
+    ungraded card images; GET only collects. Both return batch progress.
+    """
+    from grading import batch_report, make_client, poll_batches, reconcile_submissions, submit_batches
+    from models import GradingBatch
 
-    # Retry logic: 3 attempts with 3 seconds between each
-    max_attempts = 3
-    last_error = None
+    client = make_client(local=current_app.config['GRADING_LOCAL'])
+    if client is None:
+        return jsonify({'error': 'ANTHROPIC_API_KEY not configured'}), 503
 
-    for attempt in range(max_attempts):
+    reconcile_submissions(client)  # Requests left by an interrupted submission
+    running = poll_batches(client)
+    submitted = []
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
         try:
-            client = anthropic.Anthropic(api_key=api_key)
-            response = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=500,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": image_data
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ]
-            )
-
-            assessment = response.content[0].text
-
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'filepath': filepath,
-                'condition_check': assessment
-            })
-
+            submitted = submit_batches(client, tenants.upload_folder(), limit=options.get('limit'))
         except Exception as e:
-            last_error = e
-            if attempt < max_attempts - 1:
-                time.sleep(3)  # Wait 3 seconds before retrying
+            return jsonify({'error': f'Batch submission failed: {str(e)}'}), 502
 
     return jsonify({
         'success': True,
-        'filename': filename,
-        'filepath': filepath,
-        'condition_check': None,
-        'error': f'Condition check failed after {max_attempts} attempts: {str(last_error)}'
+        'submitted': [{'id': batch.id, 'requests': batch.request_count} for batch in submitted],
+        'in_progress': [batch.id for batch in running] + [batch.id for batch in submitted],
+        'report': batch_report(GradingBatch.query.filter_by(status='collected').all()),
     })
 
 
-@app.route('/settings')
+@route('/events')
+def event_stream():
+    """Server-sent events that keep open dashboards up to date (see events.py)."""
+    if not current_app.config['LIVE_EVENTS']:
+        abort(404)  # Each stream would tie up a sync worker
+    try:
+        subscription = events.broker.subscribe(tenants.current().name)
+    except events.TooManySubscribers:
+        return jsonify({'error': 'Too many live connections'}), 503
+
+    try:
+        hello = events.format_event('hello', {'dashboard': dashboard_etag()})
+    except Exception:
+        events.broker.unsubscribe(subscription)
+        raise
+    db.session.remove()  # Don't hold a pooled connection for the life of the stream
+
+    response = Response(events.stream(subscription, hello), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'  # Ask proxies not to buffer the stream
+    return response
+
+
+@route('/settings')
 def settings():
     """View and edit application settings."""
     current_settings = load_settings()
     return render_template('settings.html', settings=current_settings)
 
 
-@app.route('/settings/shipping', methods=['POST'])
+@route('/settings/shipping', methods=['POST'])
 def update_shipping_settings():
     """Update shipping settings."""
     current_settings = load_settings()
@@ -564,7 +774,7 @@ def update_shipping_settings():
     return redirect(url_for('settings'))
 
 
-@app.route('/settings/reset', methods=['POST'])
+@route('/settings/reset', methods=['POST'])
 def reset_settings():
     """Reset settings to defaults."""
     save_settings(get_default_settings())
@@ -572,10 +782,7 @@ def reset_settings():
     return redirect(url_for('settings'))
 
 
-# Create tables on startup
-with app.app_context():
-    db.create_all()
-
-
 if __name__ == '__main__':
+    app = create_app()
+    init_db(app)
     app.run(debug=True, port=5000)
@@ -0,0 +1,1053 @@
+"""
+Reproducible benchmarks for the web app and cleanup script.
+
+Builds a throwaway database and upload folder filled with synthetic
+inventory (Cards/Listings/Orders in every status, plus 600 DPI scans),
+times the main pages and cleanup functions, writes JSON results and
+compares them against a stored baseline.
+
+Usage:
+    python bench.py                     # run and compare to bench_baseline.json
+    python bench.py --save-baseline     # run and store the results as the new baseline
+    python bench.py --import-time       # check cold import time of the entry points
+    python bench.py --read-model --cards 10000   # ORM vs read model for the list views
+    python bench.py --render-cache      # uncached vs cached vs 304 for dashboard/preview
+    python bench.py --sse --subscribers 300   # live dashboard streams under serve.py
+
+Options:
+    --cards N        Number of synthetic cards (default: 500)
+    --repeat N       Timed runs per benchmark (default: 10)
+    --tolerance F    Allowed slowdown vs the baseline before failing (default: 0.25 = 25%).
+                     Each run is timed against a calibration workload run next to
+                     it, slowdowns under 1 ms never fail, and a slow benchmark is
+                     timed again before it counts.
+    --output PATH    Where to write results (default: bench_results.json)
+    --baseline PATH  Baseline to compare against (default: bench_baseline.json)
+    --seed N         Random seed for the generator (default: 1234)
+    --import-budget-ms N  Cold import budget per entry point (default: 1000)
+    --subscribers N  Idle event streams for --sse (default: 300)
+
+Exits with status 1 if any benchmark regressed beyond the tolerance, there
+is no baseline to compare against (baselines are per machine and not
+committed), or an entry point went over its import budget / loaded a heavy
+dependency.
+"""
+
+import os
+import sys
+import io
+import json
+import hashlib
+import itertools
+import time
+import random
+import shutil
+import platform
+import statistics
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, 'bench_results.json')
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'bench_baseline.json')
+NOISE_FLOOR = 0.001  # Slowdowns under 1 ms are never reported as regressions
+
+STATUSES = ['draft', 'scheduled', 'listed', 'ended_unsold', 'ended_sold', 'paid', 'shipped', 'complete']
+CARD_TYPES = ['sports', 'mtg', 'pokemon']
+CONDITIONS = {
+    'sports': ['NM', 'EX', 'VG', 'G', 'P'],
+    'mtg': ['NM', 'LP', 'MP', 'HP', 'DMG'],
+    'pokemon': ['NM', 'LP', 'MP', 'HP', 'DMG'],
+}
+
+SCAN_DPI = 600
+
+# Entry points that must start quickly, and modules they must not import
+IMPORT_ENTRY_POINTS = ['app', 'cleanup']
+HEAVY_MODULES = ['cv2', 'numpy', 'PIL', 'anthropic']
+
+
+def synthetic_scan(rng, dpi=SCAN_DPI, width_in=2.9, height_in=3.9, offset_px=(0, 0)):
+    """
+    Build a flatbed scan of a sleeved card flush to the top-left corner.
+
+    Returns a BGR uint8 array: light scanner bed, a penny sleeve outline and
+    a card face with some texture so crops and image checks have real work.
+    """
+    mm_to_px = dpi / 25.4
+    height, width = int(height_in * dpi), int(width_in * dpi)
+    scan = np.full((height, width, 3), 235, dtype=np.uint8)
+
+    top, left = offset_px
+    sleeve_w = int(2.5 * dpi + 6 * mm_to_px)
+    sleeve_h = int(3.5 * dpi + 8 * mm_to_px)
+    scan[top:top + sleeve_h, left:left + sleeve_w] = 215
+
+    card_top, card_left = top + int(5 * mm_to_px), left + int(3 * mm_to_px)
+    card_w, card_h = int(2.5 * dpi), int(3.5 * dpi)
+    color = rng.integers(40, 200, size=3, dtype=np.uint8)
+    scan[card_top:card_top + card_h, card_left:card_left + card_w] = color
+
+    # Artwork box and some noise so the image is not trivially compressible
+    art = scan[card_top + card_h // 10:card_top + card_h // 2, card_left + card_w // 10:card_left + card_w * 9 // 10]
+    art[:] = rng.integers(0, 255, size=art.shape, dtype=np.uint8)
+    cv2.rectangle(scan, (card_left, card_top), (card_left + card_w, card_top + card_h), (20, 20, 20), 8)
+
+    return scan
+
+
+def write_scan(path, rng, **kwargs):
+    """Write a synthetic scan to disk (format from the file extension)."""
+    cv2.imwrite(path, synthetic_scan(rng, **kwargs))
+    return path
+
+
+def generate_inventory(db, models, count, upload_folder, rng):
+    """
+    Create `count` cards, each with a listing cycling through every status.
+    Ended/paid/shipped listings get orders; some shipped orders are old enough
+    for cleanup, and every card points at small placeholder image files.
+    """
+    Card, Listing, Order = models.Card, models.Listing, models.Order
+    now = datetime.utcnow()
+    placeholder = cv2.imencode('.jpg', np.full((64, 48, 3), 128, dtype=np.uint8))[1].tobytes()
+
+    import storage
+
+    def store_placeholder(tag, refcount, created_at=None):
+        # Unique bytes per file so each one gets its own content address
+        data = placeholder + tag.encode()
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = storage.shard_path(sha256, 'jpg')
+        os.makedirs(os.path.join(upload_folder, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(upload_folder, path), 'wb') as f:
+            f.write(data)
+        db.session.add(models.StoredFile(sha256=sha256, path=path, size=len(data), refcount=refcount,
+                                         created_at=created_at or now))
+        return path
+
+    for i in range(count):
+        card_type = CARD_TYPES[i % len(CARD_TYPES)]
+        status = STATUSES[i % len(STATUSES)]
+
+        front = store_placeholder(f"{i}-front", 1)
+        back = store_placeholder(f"{i}-back", 1)
+
+        card = Card(
+            card_type=card_type,
+            name=f"Synthetic Card {i}",
+            set_name=random.choice(['Revised', 'Unlimited', 'Base Set', 'Topps']),
+            card_number=str(i % 300),
+            player_name=f"Player {i % 97}" if card_type == 'sports' else None,
+            year=str(1980 + i % 40) if card_type == 'sports' else None,
+            condition=CONDITIONS[card_type][i % 5],
+            quantity=1 + i % 4,
+            starting_bid=round(float(rng.uniform(0.5, 150)), 2),
+            notes="Synthetic benchmark card. " * 4,
+            private_notes="Bought in a bulk lot. " * 4,
+            foil='foil' if i % 7 == 0 else 'non-foil',
+            image_front=front,
+            image_back=back,
+            created_at=now - timedelta(days=i % 365),
+        )
+        db.session.add(card)
+        db.session.flush()
+
+        listing = Listing(
+            card_id=card.id,
+            status=status,
+            scheduled_end_time=now + timedelta(days=5),
+            current_bid=card.starting_bid * 1.5 if status == 'listed' else None,
+            winning_bid=card.starting_bid * 2 if status in ('ended_sold', 'paid', 'shipped', 'complete') else None,
+            actual_end_time=now - timedelta(days=1) if status.startswith('ended') else None,
+        )
+        db.session.add(listing)
+        db.session.flush()
+
+        if status in ('ended_sold', 'paid', 'shipped', 'complete'):
+            shipped = status in ('shipped', 'complete')
+            order = Order(
+                listing_id=listing.id,
+                buyer_username=f"buyer{i % 211}",
+                sale_price=listing.winning_bid,
+                payment_status='pending' if status == 'ended_sold' else 'paid',
+                paid_at=now - timedelta(days=i % 200) if status != 'ended_sold' else None,
+                tracking_number=f"9400{i:012d}" if shipped else None,
+                shipped_at=now - timedelta(days=i % 200) if shipped else None,
+            )
+            db.session.add(order)
+
+        if i % 500 == 499:
+            db.session.commit()
+
+    db.session.commit()
+
+    # A few orphan uploads for cleanup to find
+    for i in range(max(1, count // 20)):
+        store_placeholder(f"orphan-{i}", 0, created_at=now - timedelta(days=2))
+    db.session.commit()
+
+
+def time_call(func, repeat):
+    """Run func once to warm up, then `repeat` timed runs. Returns seconds per run."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def calibrate():
+    """Seconds for a fixed pure-Python workload: how fast the machine is right now."""
+    start = time.perf_counter()
+    sum(i * i for i in range(50_000))
+    return time.perf_counter() - start
+
+
+def time_relative(func, repeat):
+    """
+    Like time_call, but also times calibrate() right before each run.
+    Returns (seconds per run, each run's time relative to its calibration).
+    """
+    func()
+    timings, relative = [], []
+    for _ in range(repeat):
+        calibration = calibrate()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        relative.append(timings[-1] / calibration)
+    return timings, relative
+
+
+def setup_environment(count, seed):
+    """
+    Point the app at a throwaway database/upload folder, create the schema
+    and fill it with `count` synthetic cards. Returns (app, workdir, rng).
+    """
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='ebaysales-bench-')
+    upload_folder = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_folder)
+
+    # Point the app at the throwaway database/uploads before creating it
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['UPLOAD_FOLDER'] = upload_folder
+    sys.path.insert(0, BASE_DIR)
+
+    import app as app_module
+    import models
+
+    import tenants
+
+    app = app_module.create_app()
+    app_module.init_db(app)
+    # Settings saves go to the throwaway folder, not the real settings.json
+    tenants.registry(app).get().settings_file = os.path.join(workdir, 'settings.json')
+
+    with app.app_context():
+        generate_inventory(models.db, models, count, upload_folder, rng)
+
+    return app, workdir, rng
+
+
+def teardown_environment(app, workdir):
+    """Release the database and delete the throwaway folder."""
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(count=500, repeat=10, seed=1234, only=None):
+    """Build the synthetic environment and time every benchmark (or just `only`)."""
+    app, workdir, rng = setup_environment(count, seed)
+    # Time real renders; --render-cache times the cached paths
+    app.config['RENDER_CACHE'] = False
+
+    import cleanup
+    import models
+
+    with app.app_context():
+        draft_id = models.Listing.query.filter_by(status='draft').first().id
+
+    scan_path = write_scan(os.path.join(workdir, 'scan.jpg'), rng)
+    with open(scan_path, 'rb') as f:
+        scan_bytes = f.read()
+
+    client = app.test_client()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            assert response.status_code == 200, f"{url} returned {response.status_code}"
+        return call
+
+    uploads = itertools.count()
+
+    def upload():
+        # Unique bytes per call, or storage dedups the upload and skips the crop
+        data = scan_bytes + str(next(uploads)).encode()
+        response = client.post('/api/upload-image', data={
+            'side': 'front',
+            'image': (io.BytesIO(data), 'scan.jpg'),
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200, f"upload returned {response.status_code}"
+
+    def quiet(func, *args, **kwargs):
+        def call():
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(*args, **kwargs)
+        return call
+
+    benchmarks = {
+        'index': get('/'),
+        'list_cards': get('/cards'),
+        'daily_report': get('/report'),
+        'preview_listing': get(f'/listings/{draft_id}/preview'),
+        'upload_image': upload,
+        'cleanup_old_images': quiet(cleanup.cleanup_old_images, app, dry_run=True),
+        'cleanup_orphan_uploads': quiet(cleanup.cleanup_orphan_uploads, app, dry_run=True),
+    }
+
+    results = {}
+    try:
+        for name, func in benchmarks.items():
+            if only is not None and name not in only:
+                continue
+            timings, relative = time_relative(func, repeat)
+            results[name] = {
+                'median': statistics.median(timings),
+                'min': min(timings),
+                'max': max(timings),
+                'runs': repeat,
+                'relative': statistics.median(relative),
+            }
+            print(f"{name:<24} median {results[name]['median'] * 1000:9.2f} ms   min {results[name]['min'] * 1000:9.2f} ms")
+    finally:
+        teardown_environment(app, workdir)
+
+    return {
+        'meta': {
+            'cards': count,
+            'repeat': repeat,
+            'seed': seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generated_at': datetime.utcnow().isoformat(),
+        },
+        'results': results,
+    }
+
+
+def compare_read_model(count=10000, repeat=5, seed=1234):
+    """
+    Compare building + rendering the dashboard and report from ORM objects
+    (the original view code) against the column-only read model.
+    Reports the median time and peak traced memory for each path.
+    """
+    import tracemalloc
+    from flask import render_template
+
+    app, workdir, _ = setup_environment(count, seed)
+
+    import app as app_module
+    import read_models
+    from models import db, Listing
+
+    def orm_path():
+        counts = {s: Listing.query.filter_by(status=s).count() for s in read_models.COUNTED_STATUSES}
+        lists = {s: Listing.query.filter_by(status=s).all() for s in read_models.LIST_STATUSES}
+        render_template('index.html', counts=counts, drafts=lists['draft'], sold_unpaid=lists['ended_sold'],
+                        paid_unshipped=lists['paid'], active=lists['listed'],
+                        next_end_time=app_module.get_next_auction_end_time())
+        render_template('report.html', report={
+            'generated_at': datetime.now(), 'drafts_ready': counts['draft'],
+            'active_auctions': lists['listed'], 'awaiting_payment': lists['ended_sold'],
+            'needs_shipping': lists['paid'], 'recently_shipped': lists['shipped'],
+            'active_count': 0, 'payment_count': 0, 'shipping_count': 0})
+
+    def read_model_path():
+        counts = read_models.status_counts()
+        lists = read_models.listings_by_status()
+        render_template('index.html', counts=counts, drafts=lists['draft'], sold_unpaid=lists['ended_sold'],
+                        paid_unshipped=lists['paid'], active=lists['listed'],
+                        next_end_time=app_module.get_next_auction_end_time())
+        render_template('report.html', report={
+            'generated_at': datetime.now(), 'drafts_ready': len(lists['draft']),
+            'active_auctions': lists['listed'], 'awaiting_payment': lists['ended_sold'],
+            'needs_shipping': lists['paid'], 'recently_shipped': lists['shipped'],
+            'active_count': 0, 'payment_count': 0, 'shipping_count': 0})
+
+    def cold(func, reset):
+        def call():
+            db.session.remove()  # empty identity map, like a fresh request
+            reset()
+            func()
+        return call
+
+    paths = [
+        ('ORM objects', cold(orm_path, lambda: None)),
+        ('Read model (cold)', cold(read_model_path, read_models.invalidate)),
+        ('Read model (cached)', cold(read_model_path, lambda: None)),
+    ]
+
+    print(f"{'Path':<20} | {'Median ms':>10} | {'Peak MB':>8}")
+    print(f"{'-' * 20}-|-{'-' * 10}-|-{'-' * 8}")
+    try:
+        with app.test_request_context('/'):
+            for label, func in paths:
+                timings = time_call(func, repeat)
+                tracemalloc.start()
+                func()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{label:<20} | {statistics.median(timings) * 1000:>10.1f} | {peak / 1e6:>8.1f}")
+    finally:
+        teardown_environment(app, workdir)
+
+
+def compare_batch_grading(count=500, seed=1234, call_latency=0.02):
+    """
+    Grade every card image of a synthetic inventory through the local API
+    stand-in, one messages.create call at a time and as a Message Batch, then
+    interrupt a batch run between creating a batch and recording it, and
+    resume it. Reports client time and cost, and returns a list of problems
+    (card images not graded exactly once, or sent to the API more than once).
+    """
+    app, workdir, _ = setup_environment(count, seed)
+
+    import anthropic
+
+    import grading
+    from grading_local import LocalClient
+    from models import db, GradingBatch, GradingRequest
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    try:
+        with app.app_context():
+            ungraded = grading.find_ungraded()
+            client = LocalClient(call_latency=call_latency)
+
+            start = time.perf_counter()
+            input_tokens = output_tokens = 0
+            for card, side, image in ungraded:
+                messages = grading.build_condition_messages(os.path.join(upload_folder, image), image,
+                                                            card.card_type, side, card.condition_display())
+                response = client.messages.create(**grading.build_condition_params(messages, card.card_type))
+                grading.parse_condition_message(response, card.card_type)
+                input_tokens += response.usage.input_tokens
+                output_tokens += response.usage.output_tokens
+            per_card_seconds = time.perf_counter() - start
+            per_card_cost = (input_tokens * grading.PRICE_PER_MTOK['input']
+                             + output_tokens * grading.PRICE_PER_MTOK['output']) / 1e6
+
+            start = time.perf_counter()
+            batches = grading.submit_batches(client, upload_folder)
+            grading.poll_batches(client, wait=True, sleep=lambda delay: None)
+            batch_seconds = time.perf_counter() - start
+            report = grading.batch_report(batches)
+
+            # Interrupted run: the process dies after creating a batch but
+            # before recording it, then a fresh run resumes
+            GradingRequest.query.delete()
+            GradingBatch.query.delete()
+            db.session.commit()
+            client = LocalClient()
+            create = client.messages.batches.create
+
+            def create_then_crash(requests):
+                create(requests=requests)
+                raise RuntimeError('interrupted')
+
+            client.messages.batches.create = create_then_crash
+            try:
+                grading.submit_batches(client, upload_folder, limit=len(ungraded) // 2)
+            except RuntimeError:
+                pass
+            client.messages.batches.create = create
+            db.session.remove()
+            grading.reconcile_submissions(client, stale_after=timedelta(0))
+
+            # A call the API rejects must not hold its card images back
+            class Rejected(anthropic.APIStatusError):
+                def __init__(self):
+                    Exception.__init__(self, 'overloaded')
+
+            def create_rejected(requests):
+                raise Rejected()
+
+            client.messages.batches.create = create_rejected
+            try:
+                grading.submit_batches(client, upload_folder)
+            except Rejected:
+                pass
+            client.messages.batches.create = create
+            stuck = GradingRequest.query.filter_by(status='submitting').count()
+            grading.poll_batches(client)
+            grading.submit_batches(client, upload_folder)
+            grading.poll_batches(client, wait=True, sleep=lambda delay: None)
+            graded = GradingRequest.query.filter_by(status='succeeded') \
+                .with_entities(GradingRequest.card_id, GradingRequest.side).all()
+            sent = sum(len(list(client.messages.batches.results(batch.id)))
+                       for batch in client.messages.batches.list())
+    finally:
+        teardown_environment(app, workdir)
+
+    problems = []
+    if len(graded) != len(ungraded):
+        problems.append(f'{len(graded)} of {len(ungraded)} card images graded')
+    if len(set(graded)) != len(graded):
+        problems.append(f'{len(graded) - len(set(graded))} card images graded more than once')
+    if stuck:
+        problems.append(f'{stuck} requests left submitting after the API rejected a batch')
+    if sent != len(ungraded):
+        problems.append(f'{sent} requests sent to the API for {len(ungraded)} card images')
+
+    print(f"Card images: {len(ungraded)} (simulated {call_latency * 1000:.0f} ms per synchronous call)")
+    print(f"{'Mode':<12} | {'Client s':>9} | {'Cost USD':>9}")
+    print(f"{'-' * 12}-|-{'-' * 9}-|-{'-' * 9}")
+    print(f"{'Per-card':<12} | {per_card_seconds:>9.2f} | {per_card_cost:>9.4f}")
+    print(f"{'Batch':<12} | {batch_seconds:>9.2f} | {report['batch_cost']:>9.4f}")
+    print(f"Resumed after interruption: {len(set(graded))}/{len(ungraded)} card images graded, "
+          f"{sent} requests sent")
+    print(f"Problems: {len(problems)}")
+    for problem in problems:
+        print(f"  {problem}")
+    return problems
+
+
+def scan_variants(rng):
+    """Synthetic scans for each quality-gate outcome, keyed by name."""
+    def rotated(scan, degrees):
+        height, width = scan.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), degrees, 1)
+        return cv2.warpAffine(scan, matrix, (width, height), borderValue=(235, 235, 235))
+
+    return {
+        'clean': synthetic_scan(rng),
+        'blurred': cv2.GaussianBlur(synthetic_scan(rng), (0, 0), 8),
+        'skewed 2deg': rotated(synthetic_scan(rng), 2),
+        'skewed 15deg': rotated(synthetic_scan(rng), 15),
+        'off corner': synthetic_scan(rng, offset_px=(90, 140)),
+        '300 DPI': synthetic_scan(rng, dpi=300),
+        '1200 DPI': synthetic_scan(rng, dpi=1200),
+        '600, 600 hdr': synthetic_scan(rng),
+        '600, 72 hdr': synthetic_scan(rng),
+        'TIFF, 600 hdr': synthetic_scan(rng),
+    }
+
+
+# DPI written into the JFIF header of these variants (others have none)
+HEADER_DPI = {'600, 600 hdr': 600, '600, 72 hdr': 72}
+# Variants saved as TIFF, with this DPI in the resolution tags
+TIFF_DPI = {'TIFF, 600 hdr': 600}
+
+
+def set_jfif_dpi(path, dpi):
+    """Rewrite the density fields of a JPEG's JFIF header."""
+    with open(path, 'r+b') as f:
+        header = bytearray(f.read(18))
+        assert header[6:11] == b'JFIF\x00', 'no JFIF header'
+        header[13] = 1  # dots per inch
+        header[14:18] = dpi.to_bytes(2, 'big') * 2
+        f.seek(0)
+        f.write(header)
+
+
+def benchmark_scan_gate(repeat=5, seed=1234):
+    """
+    Time the scan quality gate on synthetic scans and show what it decided.
+    The gate's own reduced decode and analysis times are shown next to a
+    plain full-resolution decode for scale.
+    """
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='ebaysales-bench-')
+    sys.path.insert(0, BASE_DIR)
+
+    import imaging
+
+    print(f"{'Scan':<14} | {'Gate ms':>8} | {'Decode':>7} | {'Analyse':>7} | {'Full decode':>11} | "
+          f"{'DPI (source)':<15} | Result")
+    print(f"{'-' * 14}-|-{'-' * 8}-|-{'-' * 7}-|-{'-' * 7}-|-{'-' * 11}-|-{'-' * 15}-|-{'-' * 30}")
+    try:
+        for name, scan in scan_variants(rng).items():
+            if name in TIFF_DPI:
+                path = os.path.join(workdir, 'scan.tif')
+                cv2.imwrite(path, scan, [cv2.IMWRITE_TIFF_RESUNIT, 2, cv2.IMWRITE_TIFF_XDPI, TIFF_DPI[name],
+                                         cv2.IMWRITE_TIFF_YDPI, TIFF_DPI[name]])
+            else:
+                path = os.path.join(workdir, 'scan.jpg')
+                cv2.imwrite(path, scan)
+            if name in HEADER_DPI:
+                set_jfif_dpi(path, HEADER_DPI[name])
+
+            def gate():
+                try:
+                    return imaging.check_scan(path)[0]
+                except imaging.ScanRejected as e:
+                    return e
+
+            gate_ms = statistics.median(time_call(gate, repeat)) * 1000
+            decode_ms = statistics.median(time_call(lambda: cv2.imread(path), repeat)) * 1000
+            outcome = gate()
+            if isinstance(outcome, imaging.ScanRejected):
+                quality, result = outcome.quality, f"rejected: {outcome}"
+            else:
+                quality, result = outcome, ', '.join(outcome['corrections']) or 'ok'
+            print(f"{name:<14} | {gate_ms:>8.1f} | {quality['decode_ms']:>7.1f} | {quality['analysis_ms']:>7.1f} | "
+                  f"{decode_ms:>11.1f} | {str(quality.get('dpi')) + ' (' + str(quality.get('dpi_source')) + ')':<15} | "
+                  f"{result}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def check_tenant_isolation(cards=50, seed=1234):
+    """
+    Serve two tenants from one app concurrently: each thread adds cards,
+    uploads scans and saves settings for its own store while checking it
+    never sees the other store's data. Returns a list of problems found.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix='ebaysales-bench-')
+    names = ('alpha', 'beta')
+    tenants_file = os.path.join(workdir, 'tenants.json')
+    with open(tenants_file, 'w') as f:
+        json.dump({'tenants': {name: {'hosts': [f'{name}.test']} for name in names}}, f)
+    scan_bytes = {name: cv2.imencode('.jpg', synthetic_scan(rng))[1].tobytes() for name in names}
+    sys.path.insert(0, BASE_DIR)
+
+    import app as app_module
+    import tenants
+
+    app = app_module.create_app({'TENANTS_FILE': tenants_file})
+    app_module.init_db(app)
+
+    def exercise(name):
+        other = [n for n in names if n != name][0]
+        client = app.test_client()
+        base_url = f'http://{name}.test'
+        problems = []
+        for i in range(cards):
+            price = round(1 + names.index(name) + i / 100, 2)
+            client.post('/cards/add', base_url=base_url, data={
+                'card_type': 'mtg', 'name': f'{name}-card-{i}', 'condition': 'NM',
+                'quantity': '1', 'starting_bid': '1'})
+            client.post('/settings/shipping', base_url=base_url, data={'option_0_price': str(price)})
+            if i % 10 == 0:
+                response = client.post('/api/upload-image', base_url=base_url, data={
+                    'side': 'front', 'image': (io.BytesIO(scan_bytes[name]), 'scan.jpg')})
+                if response.status_code != 200:
+                    problems.append(f'{name}: upload returned {response.status_code}')
+                elif not os.path.exists(os.path.join(tenants.registry(app).get(name).upload_folder,
+                                                     response.get_json()['filename'])):
+                    problems.append(f'{name}: upload not in its own folder')
+
+            page = client.get('/cards', base_url=base_url).get_data(as_text=True)
+            if f'{other}-card-' in page:
+                problems.append(f'{name}: saw {other} cards')
+            if f'{name}-card-{i}' not in page:
+                problems.append(f'{name}: missing its own card {i}')
+            settings_page = client.get('/settings', base_url=base_url).get_data(as_text=True)
+            if f'value="{price}"' not in settings_page:
+                problems.append(f'{name}: settings from another store')
+        return problems
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            problems = [problem for result in pool.map(exercise, names) for problem in result]
+        elapsed = time.perf_counter() - start
+
+        from models import Card
+        for name in names:
+            with tenants.use_tenant(app, name):
+                titles = {card.name.split('-')[0] for card in Card.query}
+                if titles != {name} or Card.query.count() != cards:
+                    problems.append(f'{name}: database holds {sorted(titles)}, {Card.query.count()} cards')
+
+        print(f"Two tenants, {cards} cards each, concurrently: {elapsed:.2f}s")
+        print(f"Cross-talk problems: {len(problems)}")
+        for problem in problems[:10]:
+            print(f"  {problem}")
+        return problems
+    finally:
+        for tenant in tenants.registry(app).all():
+            tenant.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_render_cache(count=500, repeat=5, seed=1234):
+    """
+    Time the dashboard and a listing preview rendered every time, served
+    from the render cache, and answered with 304 to a conditional GET.
+    Then check that writes (in this process, from another process, and to
+    settings) change the ETag. Returns a list of problems found.
+    """
+    app, workdir, _ = setup_environment(count, seed)
+
+    import render_cache
+    from models import db, Listing
+    from sqlalchemy import update
+
+    with app.app_context():
+        draft = Listing.query.filter_by(status='draft').first()
+        draft_id, card_id = draft.id, draft.card_id
+
+    client = app.test_client()
+    pages = {'index': '/', 'preview_listing': f'/listings/{draft_id}/preview'}
+
+    def get(url, expect, **headers):
+        def call():
+            response = client.get(url, headers=headers)
+            assert response.status_code == expect, f"{url} returned {response.status_code}"
+            return response
+        return call
+
+    print(f"{'Page':<16} | {'Uncached ms':>11} | {'Cached ms':>9} | {'304 ms':>7}")
+    print(f"{'-' * 16}-|-{'-' * 11}-|-{'-' * 9}-|-{'-' * 7}")
+    problems = []
+    try:
+        for page, url in pages.items():
+            app.config['RENDER_CACHE'] = False
+            uncached = time_call(get(url, 200), repeat)
+            app.config['RENDER_CACHE'] = True
+            cached = time_call(get(url, 200), repeat)
+            etag = client.get(url).headers['ETag']
+            not_modified = time_call(get(url, 304, **{'If-None-Match': etag}), repeat)
+            print(f"{page:<16} | {statistics.median(uncached) * 1000:>11.2f} | "
+                  f"{statistics.median(cached) * 1000:>9.2f} | {statistics.median(not_modified) * 1000:>7.2f}")
+
+        def etags():
+            return {page: client.get(url).headers['ETag'] for page, url in pages.items()}
+
+        writes = [
+            ('card edit', lambda: client.post(f'/cards/{card_id}/edit', data={
+                'card_type': 'mtg', 'name': 'Edited', 'condition': 'NM', 'quantity': '2'})),
+            ('status update', lambda: client.post(f'/listings/{draft_id}/status', data={'status': 'listed'})),
+            ('settings save', lambda: client.post('/settings/shipping', data={'option_0_price': '1.25'})),
+        ]
+
+        def external_write():
+            # Another worker process: no session events reach this process's cache
+            with app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(update(Listing).where(Listing.id == draft_id)
+                                 .values(updated_at=datetime.utcnow()))
+        writes.append(('other process', external_write))
+
+        for label, write in writes:
+            before = etags()
+            write()
+            client.get('/settings')  # Show the flashed message, which is never cached
+            after = etags()
+            for page in pages:
+                if before[page] == after[page]:
+                    problems.append(f'{page}: ETag unchanged after {label}')
+
+        page = client.get(pages['index']).get_data(as_text=True)
+        if 'Ready to List' in page and f'/listings/{draft_id}/preview' in page:
+            problems.append('index: listed card still shown as a draft')
+        print(f"\nRender cache entries: {len(render_cache._cache)} ({render_cache._cache.size / 1e3:.0f} KB)")
+        print(f"Stale-page problems: {len(problems)}")
+        for problem in problems:
+            print(f"  {problem}")
+        return problems
+    finally:
+        teardown_environment(app, workdir)
+
+
+def server_rss_kb(pid):
+    """Resident memory of a process in KB (Linux only, else None)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def load_test_events(subscribers=300, writes=20, count=200, seed=1234):
+    """
+    Run serve.py on a synthetic inventory, hold `subscribers` idle /events
+    streams open, then change listing statuses and time how long each change
+    takes to reach every stream. Also checks that a client which stops
+    reading keeps a bounded queue. Returns a list of problems found.
+    """
+    import selectors
+    import socket
+    import http.client
+    import urllib.parse
+
+    import events
+
+    problems = []
+
+    # A stalled client: its queue must stay bounded and end with 'resync'
+    broker = events.Broker(queue_size=10)
+    stalled = broker.subscribe('default')
+    for i in range(25):
+        broker.publish('default', 'listing', {'listing_id': i})
+    backlog = [stalled.queue.get_nowait() for _ in range(stalled.queue.qsize())]
+    if len(backlog) != 1 or 'event: resync' not in backlog[0] or stalled.dropped != 25:
+        problems.append(f'stalled client: {len(backlog)} queued, {stalled.dropped} dropped, expected only resync')
+
+    app, workdir, _ = setup_environment(count, seed)
+    from models import db, Listing
+    with app.app_context():
+        draft_ids = [listing.id for listing in Listing.query.filter_by(status='draft').limit(writes)]
+        db.engine.dispose()
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'serve.py'), '--port', str(port)],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    selector = selectors.DefaultSelector()
+    streams = []
+    try:
+        print(server.stdout.readline().strip())
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        rss_before = server_rss_kb(server.pid)
+
+        def read_until(done, timeout=30):
+            deadline = time.monotonic() + timeout
+            while not done() and time.monotonic() < deadline:
+                for key, _ in selector.select(timeout=0.5):
+                    data = key.fileobj.recv(65536)
+                    stream = key.data
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        continue
+                    stream['buffer'] += data
+                    stream['listing_events'] = stream['buffer'].count(b'event: listing')
+                    if stream['received'] is None or stream['listing_events'] > stream['seen']:
+                        stream['received'] = time.perf_counter()
+                        stream['seen'] = stream['listing_events']
+
+        start = time.perf_counter()
+        for _ in range(subscribers):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f'GET /events HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n'.encode())
+            sock.setblocking(False)
+            stream = {'socket': sock, 'buffer': b'', 'listing_events': 0, 'seen': 0, 'received': None}
+            streams.append(stream)
+            selector.register(sock, selectors.EVENT_READ, stream)
+        read_until(lambda: all(b'event: hello' in stream['buffer'] for stream in streams))
+        connected = sum(b'event: hello' in stream['buffer'] for stream in streams)
+        connect_seconds = time.perf_counter() - start
+        if connected < subscribers:
+            problems.append(f'only {connected} of {subscribers} streams connected')
+        rss_after = server_rss_kb(server.pid)
+
+        latencies = []
+        for i, listing_id in enumerate(draft_ids, 1):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            sent = time.perf_counter()
+            conn.request('POST', f'/listings/{listing_id}/status', urllib.parse.urlencode({'status': 'listed'}),
+                         {'Content-Type': 'application/x-www-form-urlencoded'})
+            if conn.getresponse().status != 302:
+                problems.append(f'status update of listing {listing_id} failed')
+            conn.close()
+            read_until(lambda: all(stream['listing_events'] >= i for stream in streams), timeout=10)
+            missing = sum(stream['listing_events'] < i for stream in streams)
+            if missing:
+                problems.append(f'write {i}: {missing} streams did not get the event')
+            latencies.extend(stream['received'] - sent for stream in streams if stream['listing_events'] >= i)
+
+        print(f"Subscribers: {connected} connected in {connect_seconds:.2f}s")
+        if rss_before and rss_after:
+            print(f"Server memory: {rss_before / 1024:.1f} MB idle, {rss_after / 1024:.1f} MB with streams "
+                  f"({(rss_after - rss_before) / max(connected, 1):.0f} KB per stream)")
+        if latencies:
+            latencies.sort()
+            print(f"Delivery after a status change ({len(draft_ids)} writes): "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+        print(f"Problems: {len(problems)}")
+        for problem in problems[:10]:
+            print(f"  {problem}")
+        return problems
+    finally:
+        for stream in streams:
+            stream['socket'].close()
+        server.terminate()
+        server.wait()
+        teardown_environment(app, workdir)
+
+
+def measure_import(module, repeat=5):
+    """
+    Cold-import `module` in fresh interpreters with -X importtime.
+    Returns (best cumulative microseconds, heavy modules that got imported).
+    """
+    script = (f"import sys, {module}; "
+              f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                              cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        for line in proc.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            parts = line.split('|')
+            if len(parts) == 3 and parts[2].strip() == module and not parts[2].startswith('  '):
+                cumulative = int(parts[1])
+                best = cumulative if best is None else min(best, cumulative)
+        heavy = [m for m in proc.stdout.strip().split(',') if m]
+    return best, heavy
+
+
+def check_import_budget(budget_ms, repeat=5):
+    """Return the list of entry points over budget or importing heavy modules."""
+    failures = []
+    print(f"{'Entry point':<12} | {'Import ms':>9} | {'Budget ms':>9} | Heavy modules")
+    print(f"{'-' * 12}-|-{'-' * 9}-|-{'-' * 9}-|-{'-' * 14}")
+    for module in IMPORT_ENTRY_POINTS:
+        micros, heavy = measure_import(module, repeat)
+        elapsed_ms = micros / 1000
+        if elapsed_ms > budget_ms or heavy:
+            failures.append(module)
+        print(f"{module:<12} | {elapsed_ms:>9.1f} | {budget_ms:>9} | {', '.join(heavy) or '-'}")
+    return failures
+
+
+def slowdown(current, base):
+    """
+    How much slower a benchmark got vs the baseline. Uses the time relative
+    to the calibration workload when both runs have it, so a machine that is
+    busy or throttled as a whole doesn't look like a regression.
+    """
+    if current.get('relative') and base.get('relative'):
+        return current['relative'] / base['relative'] - 1
+    return current['min'] / base['min'] - 1 if base['min'] else 0.0
+
+
+def compare(results, baseline, tolerance, floor=NOISE_FLOOR):
+    """
+    Return the list of benchmarks slower than baseline * (1 + tolerance).
+    Slowdowns adding less than `floor` seconds to the fastest run are noise
+    at this scale and ignored.
+    """
+    regressions = []
+    print(f"\n{'Benchmark':<24} | {'Baseline ms':>11} | {'Current ms':>10} | {'Change':>7}   (vs calibration workload)")
+    print(f"{'-' * 24}-|-{'-' * 11}-|-{'-' * 10}-|-{'-' * 7}")
+    for name, current in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<24} | {'-':>11} | {current['min'] * 1000:>10.2f} | {'new':>7}")
+            continue
+        change = slowdown(current, base)
+        flag = ''
+        if change > tolerance and current['min'] - current['min'] / (1 + change) > floor:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<24} | {base['min'] * 1000:>11.2f} | {current['min'] * 1000:>10.2f} | {change:>+7.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the eBay card sales app')
+    parser.add_argument('--cards', type=int, default=500, help='Number of synthetic cards (default: 500)')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per benchmark (default: 10)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown vs baseline (default: 0.25)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Results file (default: bench_results.json)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file (default: bench_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed (default: 1234)')
+    parser.add_argument('--import-time', action='store_true', help='Check cold import time of the entry points')
+    parser.add_argument('--read-model', action='store_true', help='Compare ORM vs read model for the list views')
+    parser.add_argument('--scan-gate', action='store_true', help='Time the scan quality gate on synthetic scans')
+    parser.add_argument('--render-cache', action='store_true', help='Time the render cache and conditional GETs')
+    parser.add_argument('--sse', action='store_true', help='Load test live dashboard streams under serve.py')
+    parser.add_argument('--subscribers', type=int, default=300, help='Idle event streams for --sse (default: 300)')
+    parser.add_argument('--tenants', action='store_true', help='Check two tenants served concurrently stay isolated')
+    parser.add_argument('--batch-grading', action='store_true', help='Compare per-card vs batch grading (local stand-in)')
+    parser.add_argument('--import-budget-ms', type=int, default=1000, help='Import budget per entry point (default: 1000)')
+
+    args = parser.parse_args()
+
+    if args.import_time:
+        failures = check_import_budget(args.import_budget_ms, repeat=args.repeat)
+        if failures:
+            print(f"\nOver budget or importing heavy modules: {', '.join(failures)}")
+            sys.exit(1)
+        print("\nAll entry points within budget.")
+        sys.exit(0)
+
+    if args.scan_gate:
+        benchmark_scan_gate(repeat=args.repeat, seed=args.seed)
+        sys.exit(0)
+
+    if args.render_cache:
+        sys.exit(1 if compare_render_cache(count=args.cards, repeat=args.repeat, seed=args.seed) else 0)
+
+    if args.sse:
+        sys.exit(1 if load_test_events(subscribers=args.subscribers, seed=args.seed) else 0)
+
+    if args.tenants:
+        sys.exit(1 if check_tenant_isolation(seed=args.seed) else 0)
+
+    if args.batch_grading:
+        sys.exit(1 if compare_batch_grading(count=args.cards, seed=args.seed) else 0)
+
+    if args.read_model:
+        compare_read_model(count=args.cards, repeat=args.repeat, seed=args.seed)
+        sys.exit(0)
+
+    # Baselines are timings from one machine, so they are not committed
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}. Run with --save-baseline on this machine to create one.")
+        sys.exit(1)
+
+    results = run_benchmarks(count=args.cards, repeat=args.repeat, seed=args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    if baseline['meta'].get('cards') != args.cards:
+        print(f"Warning: baseline was generated with {baseline['meta'].get('cards')} cards, not {args.cards}.")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        # Noise check: a real regression is still there in a fresh environment
+        print(f"\nRe-running {', '.join(regressions)} to rule out noise...")
+        rerun = run_benchmarks(count=args.cards, repeat=args.repeat, seed=args.seed, only=regressions)
+        for name, timing in rerun['results'].items():
+            base = baseline['results'][name]
+            if slowdown(timing, base) < slowdown(results['results'][name], base):
+                results['results'][name] = timing
+        regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
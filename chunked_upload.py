@@ -0,0 +1,208 @@
+"""
+Resumable chunked uploads for large scans (tus-style protocol).
+
+A client creates an upload with the total length, then sends the file in
+chunks with PATCH requests carrying Upload-Offset and (optionally) an
+Upload-Checksum header. Chunks are streamed straight into a .part file, so
+memory per upload is bounded by the read buffer, not the file size. If the
+connection drops, the client asks for the current offset and resumes.
+
+State lives next to the uploads in .partial/<upload_id>.json/.part. Each
+request that changes an upload holds an exclusive lock on its .lock file
+(shared by every worker process), so concurrent PATCHes for the same upload
+can't both write; the loser gets 423 and resumes from the reported offset.
+"""
+
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from storage import file_sha256
+
+PARTIAL_DIR = '.partial'
+CHUNK_SIZE = 4 * 1024 * 1024  # Suggested chunk size sent to clients
+READ_BUFFER = 64 * 1024
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024  # 1GB per scan
+
+
+class UploadError(Exception):
+    """Raised for invalid chunked upload requests; carries an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def partial_folder(upload_folder):
+    folder = os.path.join(upload_folder, PARTIAL_DIR)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _paths(upload_folder, upload_id):
+    # upload ids are generated by us; reject anything else to avoid path tricks
+    try:
+        uuid.UUID(hex=upload_id)
+    except ValueError:
+        raise UploadError('Unknown upload', 404)
+    folder = partial_folder(upload_folder)
+    return os.path.join(folder, f"{upload_id}.json"), os.path.join(folder, f"{upload_id}.part")
+
+
+@contextmanager
+def _locked(upload_folder, upload_id):
+    """Hold the upload's lock for a load/check/write/save sequence."""
+    state_path, _ = _paths(upload_folder, upload_id)
+    if not os.path.exists(state_path):
+        raise UploadError('Unknown upload', 404)  # Don't leave lock files for unknown ids
+    with open(state_path[:-len('.json')] + '.lock', 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Another request is writing to this upload', 423)
+        yield  # Released when the file is closed
+
+
+def _remove_lock(state_path):
+    lock_path = state_path[:-len('.json')] + '.lock'
+    if os.path.exists(lock_path):
+        os.remove(lock_path)
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def load_upload(upload_folder, upload_id):
+    """Return the saved state for an upload."""
+    state_path, _ = _paths(upload_folder, upload_id)
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload', 404)
+
+
+def create_upload(upload_folder, filename, side, length, checksum=None):
+    """Start a new upload and return its state."""
+    if length <= 0 or length > MAX_UPLOAD_SIZE:
+        raise UploadError(f'Upload length must be between 1 and {MAX_UPLOAD_SIZE} bytes', 413)
+
+    upload_id = uuid.uuid4().hex
+    state_path, part_path = _paths(upload_folder, upload_id)
+    state = {
+        'id': upload_id,
+        'filename': filename,
+        'side': side,
+        'length': length,
+        'offset': 0,
+        'checksum': checksum,  # optional sha256 hex of the whole file
+        'created_at': datetime.utcnow().isoformat(),
+    }
+    open(part_path, 'wb').close()
+    _save_state(state_path, state)
+    return state
+
+
+def parse_checksum_header(value):
+    """Parse 'sha256 <base64 digest>' into raw digest bytes (None if absent)."""
+    if not value:
+        return None
+    try:
+        algorithm, encoded = value.split(' ', 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        raise UploadError('Malformed Upload-Checksum header')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Unsupported checksum algorithm', 400)
+    return digest
+
+
+def write_chunk(upload_folder, upload_id, offset, stream, chunk_checksum=None):
+    """
+    Append one chunk read from `stream` at `offset`.
+
+    The offset must match what the server already has (409 otherwise). If a
+    checksum was sent and does not match, the chunk is discarded (460) and
+    the client can resend it. A request already writing to the upload makes
+    this one fail with 423. Returns the updated state.
+    """
+    with _locked(upload_folder, upload_id):
+        return _write_chunk(upload_folder, upload_id, offset, stream, chunk_checksum)
+
+
+def _write_chunk(upload_folder, upload_id, offset, stream, chunk_checksum):
+    state = load_upload(upload_folder, upload_id)
+    state_path, part_path = _paths(upload_folder, upload_id)
+
+    if offset != state['offset']:
+        raise UploadError(f"Offset mismatch: server has {state['offset']} bytes", 409)
+
+    remaining = state['length'] - offset
+    digest = hashlib.sha256()
+    written = 0
+
+    with open(part_path, 'r+b') as f:
+        f.seek(offset)
+        while True:
+            block = stream.read(READ_BUFFER)
+            if not block:
+                break
+            written += len(block)
+            if written > remaining:
+                f.truncate(offset)
+                raise UploadError('Chunk exceeds the declared upload length', 413)
+            digest.update(block)
+            f.write(block)
+
+        if chunk_checksum is not None and digest.digest() != chunk_checksum:
+            f.truncate(offset)
+            raise UploadError('Chunk checksum mismatch', 460)
+
+    state['offset'] = offset + written
+    _save_state(state_path, state)
+    return state
+
+
+def finish_upload(upload_folder, upload_id):
+    """
+    Verify the whole-file checksum (if one was declared) and return the path
+    of the assembled .part file for the caller to move into place (it is
+    renamed, never copied).
+    """
+    with _locked(upload_folder, upload_id):
+        state = load_upload(upload_folder, upload_id)
+        state_path, part_path = _paths(upload_folder, upload_id)
+
+        if state['offset'] != state['length']:
+            raise UploadError('Upload is not complete', 409)
+
+        if state.get('checksum') and file_sha256(part_path) != state['checksum'].lower():
+            _discard(state_path, part_path)
+            raise UploadError('File checksum mismatch, upload discarded', 460)
+
+        # Without its state the upload is gone: later requests get 404
+        os.remove(state_path)
+        _remove_lock(state_path)
+        return part_path
+
+
+def discard_upload(upload_folder, upload_id):
+    """Delete an upload's state and partial data."""
+    with _locked(upload_folder, upload_id):
+        _discard(*_paths(upload_folder, upload_id))
+
+
+def _discard(state_path, part_path):
+    for path in (state_path, part_path):
+        if os.path.exists(path):
+            os.remove(path)
+    _remove_lock(state_path)
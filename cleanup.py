@@ -8,25 +8,69 @@ Run manually or schedule with Windows Task Scheduler:
 Options:
     --dry-run    Show what would be deleted without actually deleting
     --days N     Override the 90-day default
+    --scan-legacy  Also look for orphans among uploads saved before the
+                   content-addressed store (full directory scan)
+    --tenant NAME  Clean up one store from tenants.json (default store otherwise)
+    --all-tenants  Clean up every store, in parallel
 """
 
+import contextlib
+import io
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
 # Add the app directory to path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app, db
-from models import Card, Listing, Order
+from app import create_app, db
+from models import Card, Listing, Order, StoredFile
+import chunked_upload
+import condition_results
+import storage
+import tenants
 
 
-def cleanup_old_images(days=90, dry_run=False):
+def remove_card_image(uploads_folder, path, dry_run=False):
+    """
+    Drop one card's reference to an image and delete the file if nothing
+    else uses it. Returns 'deleted', 'shared' or 'not_found'.
+    """
+    stored = StoredFile.query.filter_by(path=path).first()
+
+    if stored is not None:
+        # Content-addressed file: other cards may share the same scan
+        if stored.refcount > 1:
+            if not dry_run:
+                storage.release_reference(path)
+            return 'shared'
+        if dry_run:
+            print(f"[DRY RUN] Would delete: {path}")
+        else:
+            storage.delete_stored_file(uploads_folder, stored)
+            print(f"Deleted: {path}")
+        return 'deleted'
+
+    # Legacy upload saved before the content-addressed store
+    filepath = os.path.join(uploads_folder, path)
+    if not os.path.exists(filepath):
+        return 'not_found'
+    if dry_run:
+        print(f"[DRY RUN] Would delete: {path}")
+    else:
+        os.remove(filepath)
+        print(f"Deleted: {path}")
+    return 'deleted'
+
+
+def cleanup_old_images(app, days=90, dry_run=False, tenant=None):
     """Delete images for cards where shipping completed more than N days ago."""
 
     cutoff_date = datetime.utcnow() - timedelta(days=days)
 
-    with app.app_context():
+    with tenants.use_tenant(app, tenant):
         # Find orders shipped more than N days ago
         old_orders = Order.query.filter(
             Order.shipped_at.isnot(None),
@@ -37,11 +81,10 @@ def cleanup_old_images(days=90, dry_run=False):
             print(f"No orders shipped before {cutoff_date.strftime('%Y-%m-%d')}. Nothing to clean up.")
             return
 
-        files_deleted = 0
-        files_not_found = 0
+        results = {'deleted': 0, 'shared': 0, 'not_found': 0}
         cards_processed = 0
 
-        uploads_folder = os.path.join(os.path.dirname(__file__), 'uploads')
+        uploads_folder = tenants.upload_folder()
 
         for order in old_orders:
             listing = order.listing
@@ -53,37 +96,17 @@ def cleanup_old_images(days=90, dry_run=False):
                 continue
 
             cards_processed += 1
+            if not dry_run and (card.image_front or card.image_back):
+                listing.updated_at = datetime.utcnow()  # Listing pages render the card
 
-            # Check for front image
             if card.image_front:
-                filepath = os.path.join(uploads_folder, card.image_front)
-                if os.path.exists(filepath):
-                    if dry_run:
-                        print(f"[DRY RUN] Would delete: {card.image_front}")
-                    else:
-                        os.remove(filepath)
-                        print(f"Deleted: {card.image_front}")
-                    files_deleted += 1
-                else:
-                    files_not_found += 1
-
+                results[remove_card_image(uploads_folder, card.image_front, dry_run)] += 1
                 # Clear the path in database
                 if not dry_run:
                     card.image_front = None
 
-            # Check for back image
             if card.image_back:
-                filepath = os.path.join(uploads_folder, card.image_back)
-                if os.path.exists(filepath):
-                    if dry_run:
-                        print(f"[DRY RUN] Would delete: {card.image_back}")
-                    else:
-                        os.remove(filepath)
-                        print(f"Deleted: {card.image_back}")
-                    files_deleted += 1
-                else:
-                    files_not_found += 1
-
+                results[remove_card_image(uploads_folder, card.image_back, dry_run)] += 1
                 # Clear the path in database
                 if not dry_run:
                     card.image_back = None
@@ -93,47 +116,122 @@ def cleanup_old_images(days=90, dry_run=False):
 
         print(f"\n--- Summary ---")
         print(f"Cards processed: {cards_processed}")
-        print(f"Files {'would be ' if dry_run else ''}deleted: {files_deleted}")
-        if files_not_found:
-            print(f"Files not found (already deleted): {files_not_found}")
+        print(f"Files {'would be ' if dry_run else ''}deleted: {results['deleted']}")
+        if results['shared']:
+            print(f"Files kept (still used by other cards): {results['shared']}")
+        if results['not_found']:
+            print(f"Files not found (already deleted): {results['not_found']}")
 
 
-def cleanup_orphan_uploads(dry_run=False):
+def cleanup_orphan_uploads(app, dry_run=False, grace_hours=24, scan_legacy=False, tenant=None):
     """
     Delete uploaded files that aren't referenced by any card.
     This handles the case where someone uploads multiple times before saving.
+
+    Stored files are found with an indexed refcount query. Uploads younger
+    than grace_hours are kept, since their card may not be saved yet.
+    scan_legacy also sweeps the top level of the uploads folder for files
+    saved before the content-addressed store existed.
     """
 
-    uploads_folder = os.path.join(os.path.dirname(__file__), 'uploads')
+    uploads_folder = tenants.registry(app).get(tenant).upload_folder
 
     if not os.path.exists(uploads_folder):
         print("Uploads folder doesn't exist.")
         return
 
-    with app.app_context():
-        # Get all referenced filenames from the database
-        referenced_files = set()
-        cards = Card.query.all()
-        for card in cards:
-            if card.image_front:
-                referenced_files.add(card.image_front)
-            if card.image_back:
-                referenced_files.add(card.image_back)
-
-        # Check all files in uploads folder
+    with tenants.use_tenant(app, tenant):
         orphans_deleted = 0
-        for filename in os.listdir(uploads_folder):
-            filepath = os.path.join(uploads_folder, filename)
-            if os.path.isfile(filepath) and filename not in referenced_files:
+        for stored in storage.unreferenced_files(grace_hours):
+            if dry_run:
+                print(f"[DRY RUN] Would delete orphan: {stored.path}")
+            else:
+                storage.delete_stored_file(uploads_folder, stored)
+                print(f"Deleted orphan: {stored.path}")
+            orphans_deleted += 1
+
+        if not dry_run:
+            db.session.commit()
+
+        if scan_legacy:
+            # Get all referenced filenames from the database
+            referenced_files = set()
+            for image_front, image_back in db.session.query(Card.image_front, Card.image_back):
+                referenced_files.add(image_front)
+                referenced_files.add(image_back)
+
+            # Sharded store directories are skipped by the isfile() check
+            for filename in os.listdir(uploads_folder):
+                filepath = os.path.join(uploads_folder, filename)
+                if os.path.isfile(filepath) and filename not in referenced_files:
+                    if dry_run:
+                        print(f"[DRY RUN] Would delete orphan: {filename}")
+                    else:
+                        os.remove(filepath)
+                        condition_results.delete_unlinked(filename)
+                        print(f"Deleted orphan: {filename}")
+                    orphans_deleted += 1
+
+            if not dry_run:
+                db.session.commit()
+
+        print(f"\n--- Orphan Cleanup Summary ---")
+        print(f"Orphan files {'would be ' if dry_run else ''}deleted: {orphans_deleted}")
+
+
+def cleanup_stale_partial_uploads(app, hours=24, dry_run=False, tenant=None):
+    """Delete chunked or interrupted uploads abandoned more than N hours ago."""
+
+    cutoff = time.time() - hours * 3600
+    stale_deleted = 0
+    uploads_folder = tenants.registry(app).get(tenant).upload_folder
+
+    for subfolder in (chunked_upload.PARTIAL_DIR, storage.INCOMING_DIR):
+        partial_folder = os.path.join(uploads_folder, subfolder)
+        if not os.path.exists(partial_folder):
+            continue
+
+        for filename in os.listdir(partial_folder):
+            filepath = os.path.join(partial_folder, filename)
+            if os.path.isfile(filepath) and os.path.getmtime(filepath) < cutoff:
                 if dry_run:
-                    print(f"[DRY RUN] Would delete orphan: {filename}")
+                    print(f"[DRY RUN] Would delete stale partial upload: {filename}")
                 else:
                     os.remove(filepath)
-                    print(f"Deleted orphan: {filename}")
-                orphans_deleted += 1
+                    print(f"Deleted stale partial upload: {filename}")
+                stale_deleted += 1
 
-        print(f"\n--- Orphan Cleanup Summary ---")
-        print(f"Orphan files {'would be ' if dry_run else ''}deleted: {orphans_deleted}")
+    if stale_deleted:
+        print(f"Stale partial upload files {'would be ' if dry_run else ''}deleted: {stale_deleted}")
+
+
+def run_cleanup(app, tenant=None, days=90, dry_run=False, orphans_only=False, scan_legacy=False):
+    """Run the full cleanup for one tenant."""
+    if not orphans_only:
+        cleanup_old_images(app, days=days, dry_run=dry_run, tenant=tenant)
+        print()
+    cleanup_orphan_uploads(app, dry_run=dry_run, scan_legacy=scan_legacy, tenant=tenant)
+    cleanup_stale_partial_uploads(app, dry_run=dry_run, tenant=tenant)
+
+
+def sweep_tenant(tenant, options):
+    """
+    Clean up one tenant in a worker process and return what it printed, so
+    parallel sweeps don't interleave their output.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run_cleanup(create_app(), tenant=tenant, **options)
+    return output.getvalue()
+
+
+def sweep_all_tenants(app, workers=None, **options):
+    """Clean up every tenant in parallel, one process per tenant."""
+    names = [tenant.name for tenant in tenants.registry(app).all()]
+    with ProcessPoolExecutor(max_workers=workers or min(len(names), os.cpu_count() or 1)) as pool:
+        for name, output in zip(names, pool.map(sweep_tenant, names, [options] * len(names))):
+            print(f"=== Tenant: {name} ===")
+            print(output)
 
 
 if __name__ == '__main__':
@@ -143,15 +241,21 @@ if __name__ == '__main__':
     parser.add_argument('--dry-run', action='store_true', help='Show what would be deleted without deleting')
     parser.add_argument('--days', type=int, default=90, help='Days after shipping to keep images (default: 90)')
     parser.add_argument('--orphans-only', action='store_true', help='Only clean up orphan files, not old shipped orders')
+    parser.add_argument('--scan-legacy', action='store_true', help='Also scan the uploads folder for pre-store orphan files')
+    parser.add_argument('--tenant', help='Store to clean up (default: the default store)')
+    parser.add_argument('--all-tenants', action='store_true', help='Clean up every store in parallel')
 
     args = parser.parse_args()
+    app = create_app()
+    if not args.all_tenants:
+        tenants.check_script_tenant(parser, app, args.tenant)
 
     if args.dry_run:
         print("=== DRY RUN MODE - No files will be deleted ===\n")
 
-    if args.orphans_only:
-        cleanup_orphan_uploads(dry_run=args.dry_run)
+    options = dict(days=args.days, dry_run=args.dry_run, orphans_only=args.orphans_only,
+                   scan_legacy=args.scan_legacy)
+    if args.all_tenants:
+        sweep_all_tenants(app, **options)
     else:
-        cleanup_old_images(days=args.days, dry_run=args.dry_run)
-        print()
-        cleanup_orphan_uploads(dry_run=args.dry_run)
+        run_cleanup(app, tenant=args.tenant, **options)
@@ -0,0 +1,202 @@
+"""
+Structured condition assessments.
+
+The model records its assessment through a tool call (see condition_tool),
+so the result arrives as JSON. It is validated once here and stored in the
+condition_results table, one row per card side. Each row keeps the rank of
+the estimated grade and its gap to the seller's selected condition, so
+questions like "which cards did the model grade below the seller's grade"
+are indexed lookups instead of re-parsing assessment text.
+"""
+
+import re
+
+from sqlalchemy import update
+
+from models import db, Card, ConditionResult
+
+TOOL_NAME = 'record_condition'
+
+# Condition scales, best first
+SPORTS_GRADES = ('NM', 'EX', 'VG', 'G', 'P')
+TCG_GRADES = ('NM', 'LP', 'MP', 'HP', 'DMG')
+
+SELLER_GRADE_VERDICTS = ('accurate', 'too_generous', 'too_conservative')
+MAX_FIELD_LENGTH = 500
+
+CENTERING_PATTERN = re.compile(r'^\s*(\d{1,3})\s*/\s*(\d{1,3})\s*$')
+
+
+class ConditionResultError(ValueError):
+    """Raised when a condition result is missing fields or out of range."""
+
+
+def grade_scale(card_type):
+    return SPORTS_GRADES if card_type == 'sports' else TCG_GRADES
+
+
+def grade_rank(card_type, grade):
+    """Rank of a grade on the card type's scale (higher is better), or None."""
+    scale = grade_scale(card_type)
+    if grade not in scale:
+        return None
+    return len(scale) - scale.index(grade)
+
+
+def condition_tool(card_type):
+    """Tool definition the model must call with its assessment."""
+    text = {'type': 'string', 'maxLength': MAX_FIELD_LENGTH}
+    return {
+        'name': TOOL_NAME,
+        'description': 'Record the condition assessment of a trading card scan.',
+        'input_schema': {
+            'type': 'object',
+            'properties': {
+                'corners': dict(text, description='Whitening, dings or wear on the corners'),
+                'edges': dict(text, description='Whitening, chipping or roughness on the edges'),
+                'surface': dict(text, description='Scratches, print defects, staining or creases'),
+                'centering': {'type': 'string', 'description': 'Estimated centering as a split, e.g. 55/45'},
+                'estimated_grade': {'type': 'string', 'enum': list(grade_scale(card_type))},
+                'seller_grade': {'type': 'string', 'enum': list(SELLER_GRADE_VERDICTS),
+                                 'description': "Whether the seller's selected condition is accurate"},
+                'notes': dict(text, description='Specific issues a buyer might notice'),
+            },
+            'required': ['corners', 'edges', 'surface', 'centering', 'estimated_grade'],
+        },
+    }
+
+
+def validate_result(data, card_type):
+    """Check a tool call's input and return the cleaned result dict."""
+    if not isinstance(data, dict):
+        raise ConditionResultError('Condition result is not an object')
+
+    result = {}
+    for field in ('corners', 'edges', 'surface', 'notes'):
+        value = data.get(field) or ''
+        if not isinstance(value, str):
+            raise ConditionResultError(f'{field} must be text')
+        if not value.strip() and field != 'notes':
+            raise ConditionResultError(f'{field} is missing')
+        result[field] = value.strip()[:MAX_FIELD_LENGTH]
+
+    match = CENTERING_PATTERN.match(str(data.get('centering', '')))
+    if not match or int(match.group(1)) + int(match.group(2)) != 100:
+        raise ConditionResultError(f"Invalid centering: {data.get('centering')!r}")
+    worst = max(int(match.group(1)), int(match.group(2)))
+    result['centering'] = f"{worst}/{100 - worst}"
+
+    grade = str(data.get('estimated_grade', '')).strip().upper()
+    if grade_rank(card_type, grade) is None:
+        raise ConditionResultError(f'Invalid grade for {card_type} cards: {grade!r}')
+    result['estimated_grade'] = grade
+
+    verdict = data.get('seller_grade')
+    if verdict is not None and verdict not in SELLER_GRADE_VERDICTS:
+        raise ConditionResultError(f'Invalid seller_grade: {verdict!r}')
+    result['seller_grade'] = verdict
+    return result
+
+
+def format_result(result):
+    """Readable text of a result, as shown under the uploaded image."""
+    lines = [
+        f"Corners: {result['corners']}",
+        f"Edges: {result['edges']}",
+        f"Surface: {result['surface']}",
+        f"Centering: {result['centering']}",
+        '',
+        f"Estimated grade: {result['estimated_grade']}",
+    ]
+    if result.get('seller_grade'):
+        lines.append(f"Selected condition looks {result['seller_grade'].replace('_', ' ')}.")
+    if result.get('notes'):
+        lines.append(result['notes'])
+    return '\n'.join(lines)
+
+
+def selected_rank(card):
+    """Rank of the seller's selected condition (None for slabbed cards)."""
+    if card.is_graded:
+        return None
+    return grade_rank(card.card_type, card.condition)
+
+
+def save_result(result, image, side, card_type, card=None, source='check'):
+    """
+    Store a validated result, replacing the previous one for the same card
+    side (or, before the card exists, the same image). Caller commits.
+    """
+    query = ConditionResult.query.filter_by(side=side)
+    if card is not None:
+        query = query.filter_by(card_id=card.id)
+    else:
+        query = query.filter_by(card_id=None, image=image)
+    query.delete(synchronize_session=False)
+
+    rank = grade_rank(card_type, result['estimated_grade'])
+    selected = selected_rank(card) if card is not None else None
+    row = ConditionResult(
+        card_id=card.id if card is not None else None,
+        side=side,
+        image=image,
+        source=source,
+        corners=result['corners'],
+        edges=result['edges'],
+        surface=result['surface'],
+        centering=result['centering'],
+        centering_worst=int(result['centering'].split('/')[0]),
+        estimated_grade=result['estimated_grade'],
+        grade_rank=rank,
+        notes=result.get('notes'),
+        grade_gap=selected - rank if selected is not None else None,
+    )
+    db.session.add(row)
+    return row
+
+
+def delete_unlinked(image):
+    """Delete upload-time results for an image no card was saved with. Caller commits."""
+    ConditionResult.query.filter_by(card_id=None, image=image).delete(synchronize_session=False)
+
+
+def link_card(card):
+    """
+    Attach upload-time results for the card's images and refresh grade gaps
+    after the card's images or condition change. Call after a flush so the
+    card has an id; caller commits.
+    """
+    for side, image in (('front', card.image_front), ('back', card.image_back)):
+        # Results for an image the card no longer uses are stale
+        ConditionResult.query.filter(
+            ConditionResult.card_id == card.id,
+            ConditionResult.side == side,
+            ConditionResult.image != image
+        ).delete(synchronize_session=False)
+        if image:
+            ConditionResult.query.filter_by(card_id=None, image=image, side=side).update(
+                {'card_id': card.id}, synchronize_session=False)
+
+    selected = selected_rank(card)
+    db.session.execute(
+        update(ConditionResult)
+        .where(ConditionResult.card_id == card.id)
+        .values(grade_gap=selected - ConditionResult.grade_rank if selected is not None else None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def graded_below_selected(limit=None):
+    """
+    (Card, ConditionResult) pairs where the model's grade is below the
+    seller's selected condition, largest gap first.
+    """
+    query = (
+        db.session.query(Card, ConditionResult)
+        .join(ConditionResult, ConditionResult.card_id == Card.id)
+        .filter(ConditionResult.grade_gap > 0)
+        .order_by(ConditionResult.grade_gap.desc(), Card.id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
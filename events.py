@@ -0,0 +1,136 @@
+"""
+In-process pub/sub for live dashboard updates over server-sent events.
+
+Routes publish small JSON deltas after they commit: listing status changes
+(with the listing's re-rendered dashboard row and the status counts),
+finished uploads and condition grading results. Each /events client has
+its own bounded queue. A client that falls SUBSCRIBER_QUEUE_SIZE events
+behind has its backlog dropped and gets only 'resync', so the page reloads
+instead of the server buffering without limit.
+
+Events only reach clients connected to the process that published them, so
+live updates need the app served by a single process (see serve.py), where
+idle streams are cheap.
+"""
+
+import json
+import queue
+import threading
+from collections import defaultdict
+
+import tenants
+
+SUBSCRIBER_QUEUE_SIZE = 100
+MAX_SUBSCRIBERS = 1000  # Per process, across tenants
+KEEPALIVE_SECONDS = 15  # Comment line sent to idle streams; also detects closed connections
+RETRY_MS = 3000  # How long browsers wait before reconnecting
+
+
+class TooManySubscribers(Exception):
+    """Raised when the process already serves MAX_SUBSCRIBERS streams."""
+
+
+def format_event(event, data, event_id=None):
+    """One SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """One connected client: a bounded queue of formatted messages."""
+
+    def __init__(self, tenant, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.tenant = tenant
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.lagged = False  # Told to resync; later messages are dropped
+
+    def put(self, message):
+        """Queue a message without blocking (the broker serialises producers)."""
+        if self.lagged:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Too far behind: drop the backlog and have the page reload
+            self.lagged = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            self.dropped += 1
+            self.queue.put_nowait(format_event('resync', {}))
+
+    def messages(self, keepalive=KEEPALIVE_SECONDS):
+        """Yield queued messages forever, with a keepalive comment when idle."""
+        while True:
+            try:
+                yield self.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+
+
+class Broker:
+    """Subscriptions per tenant; publish() fans a message out to all of them."""
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE, max_subscribers=MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, tenant):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers()
+            subscription = Subscription(tenant, self.queue_size)
+            self._subscribers[tenant].add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.tenant)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.remove(subscription)
+                self._count -= 1
+
+    def publish(self, tenant, event, data):
+        """Send an event to every subscriber of a tenant. Returns how many."""
+        with self._lock:
+            self._sequence += 1
+            message = format_event(event, data, self._sequence)
+            subscribers = self._subscribers.get(tenant, ())
+            for subscription in subscribers:
+                subscription.put(message)
+            return len(subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+
+broker = Broker()
+
+
+def publish(event, data):
+    """Publish an event to the current tenant's subscribers (call after commit)."""
+    return broker.publish(tenants.current().name, event, data)
+
+
+def stream(subscription, hello):
+    """SSE response body: the hello event, then the subscription's messages."""
+    try:
+        yield f"retry: {RETRY_MS}\n" + hello
+        yield from subscription.messages()
+    finally:
+        broker.unsubscribe(subscription)
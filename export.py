@@ -0,0 +1,315 @@
+"""
+Export sales history to a columnar file for offline analysis.
+Streams Cards joined with their Listings and Orders in chunks, so memory
+stays bounded by the chunk size rather than the size of the database.
+
+Writes Parquet when pyarrow is installed, otherwise one compressed NumPy
+.npz file per chunk. Each run only exports rows changed since the last
+export (tracked by updated_at in exports/watermark.json). With a tenants
+file, each store exports into its own exports/<store>/ folder and keeps
+its own watermark.
+
+Run manually or schedule alongside cleanup.py:
+    python export.py
+
+Options:
+    --full           Ignore the watermark and export everything
+    --chunk-size N   Rows per chunk / row group (default: 5000)
+    --out DIR        Output directory (default: exports/)
+    --format F       'parquet' or 'npz' (default: parquet if pyarrow is installed)
+    --benchmark      Compare export speed against iterating ORM objects
+    --tenant NAME    Store from tenants.json to export (default store otherwise)
+    --all-tenants    Export every store
+"""
+
+import os
+import sys
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, or_
+
+# Add the app directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import create_app, db
+from models import Card, Listing, Order
+import tenants
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional
+    pa = None
+    pq = None
+
+EXPORT_FOLDER = os.path.join(os.path.dirname(__file__), 'exports')
+WATERMARK_FILE = 'watermark.json'
+
+# (column name, SQLAlchemy column, kind) - kind drives the columnar dtype
+EXPORT_COLUMNS = [
+    ('card_id', Card.id, 'int'),
+    ('card_type', Card.card_type, 'str'),
+    ('name', Card.name, 'str'),
+    ('set_name', Card.set_name, 'str'),
+    ('card_number', Card.card_number, 'str'),
+    ('player_name', Card.player_name, 'str'),
+    ('year', Card.year, 'str'),
+    ('condition', Card.condition, 'str'),
+    ('is_graded', Card.is_graded, 'bool'),
+    ('grading_company', Card.grading_company, 'str'),
+    ('grade', Card.grade, 'str'),
+    ('quantity', Card.quantity, 'int'),
+    ('starting_bid', Card.starting_bid, 'float'),
+    ('foil', Card.foil, 'str'),
+    ('card_created_at', Card.created_at, 'datetime'),
+    ('listing_id', Listing.id, 'int'),
+    ('ebay_listing_id', Listing.ebay_listing_id, 'str'),
+    ('status', Listing.status, 'str'),
+    ('scheduled_end_time', Listing.scheduled_end_time, 'datetime'),
+    ('actual_start_time', Listing.actual_start_time, 'datetime'),
+    ('actual_end_time', Listing.actual_end_time, 'datetime'),
+    ('current_bid', Listing.current_bid, 'float'),
+    ('winning_bid', Listing.winning_bid, 'float'),
+    ('ebay_fees', Listing.ebay_fees, 'float'),
+    ('listing_updated_at', Listing.updated_at, 'datetime'),
+    ('order_id', Order.id, 'int'),
+    ('ebay_order_id', Order.ebay_order_id, 'str'),
+    ('buyer_username', Order.buyer_username, 'str'),
+    ('sale_price', Order.sale_price, 'float'),
+    ('shipping_cost', Order.shipping_cost, 'float'),
+    ('total_price', Order.total_price, 'float'),
+    ('payment_status', Order.payment_status, 'str'),
+    ('paid_at', Order.paid_at, 'datetime'),
+    ('shipping_carrier', Order.shipping_carrier, 'str'),
+    ('shipped_at', Order.shipped_at, 'datetime'),
+    ('order_updated_at', Order.updated_at, 'datetime'),
+]
+
+# Columns whose max becomes the next watermark
+WATERMARK_COLUMNS = ('card_created_at', 'listing_updated_at', 'order_updated_at')
+
+
+def load_watermark(out_dir):
+    """Return the updated_at of the last export, or None for a first run."""
+    try:
+        with open(os.path.join(out_dir, WATERMARK_FILE), 'r') as f:
+            return datetime.fromisoformat(json.load(f)['updated_at'])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def save_watermark(out_dir, updated_at, rows):
+    """Record the newest updated_at exported so the next run starts after it."""
+    with open(os.path.join(out_dir, WATERMARK_FILE), 'w') as f:
+        json.dump({
+            'updated_at': updated_at.isoformat(),
+            'exported_at': datetime.utcnow().isoformat(),
+            'rows': rows,
+        }, f, indent=4)
+
+
+def build_export_query(since=None):
+    """Select only the exported columns, never full ORM objects."""
+    stmt = (
+        select(*[column for _, column, _ in EXPORT_COLUMNS])
+        .select_from(Card)
+        .outerjoin(Listing, Listing.card_id == Card.id)
+        .outerjoin(Order, Order.listing_id == Listing.id)
+        .order_by(Card.id)
+    )
+    if since is not None:
+        stmt = stmt.where(or_(
+            Card.created_at > since,
+            Listing.updated_at > since,
+            Order.updated_at > since,
+        ))
+    return stmt
+
+
+def iter_chunks(since=None, chunk_size=5000):
+    """Yield lists of row tuples, at most chunk_size rows at a time."""
+    stmt = build_export_query(since).execution_options(yield_per=chunk_size)
+    result = db.session.execute(stmt)
+    for partition in result.partitions(chunk_size):
+        yield partition
+
+
+def to_numpy_columns(rows):
+    """Transpose a chunk of rows into one NumPy array per column.
+
+    Missing values are NaN for floats, NaT for datetimes, -1 for ints/bools
+    and '' for strings, so every chunk has the same dtypes.
+    """
+    columns = {}
+    for i, (name, _, kind) in enumerate(EXPORT_COLUMNS):
+        values = [row[i] for row in rows]
+        if kind == 'int' or kind == 'bool':
+            columns[name] = np.array([-1 if v is None else int(v) for v in values], dtype=np.int64)
+        elif kind == 'float':
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        elif kind == 'datetime':
+            columns[name] = np.array([np.datetime64('NaT') if v is None else v for v in values],
+                                     dtype='datetime64[us]')
+        else:
+            columns[name] = np.array(['' if v is None else v for v in values], dtype=np.str_)
+    return columns
+
+
+def arrow_schema():
+    """Arrow schema for the export; nullable columns keep real nulls."""
+    types = {'int': pa.int64(), 'bool': pa.bool_(), 'float': pa.float64(),
+             'datetime': pa.timestamp('us'), 'str': pa.string()}
+    return pa.schema([(name, types[kind]) for name, _, kind in EXPORT_COLUMNS])
+
+
+def to_arrow_batch(rows, schema):
+    """Transpose a chunk of rows into an Arrow record batch."""
+    arrays = [pa.array([row[i] for row in rows], type=schema.field(i).type)
+              for i in range(len(EXPORT_COLUMNS))]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def chunk_watermark(rows):
+    """Newest change timestamp in a chunk of rows."""
+    indexes = [i for i, (name, _, _) in enumerate(EXPORT_COLUMNS) if name in WATERMARK_COLUMNS]
+    stamps = [row[i] for row in rows for i in indexes if row[i] is not None]
+    return max(stamps) if stamps else None
+
+
+def tenant_out_dir(app, out_dir, tenant=None):
+    """Output folder of a store: its own subfolder once a tenants file is used."""
+    if not tenants.registry(app).configured:
+        return out_dir
+    return os.path.join(out_dir, tenants.registry(app).get(tenant).name)
+
+
+def export_sales(app, out_dir=EXPORT_FOLDER, full=False, chunk_size=5000, fmt=None, tenant=None):
+    """Export one store's changed rows since its last watermark. Returns (rows, files)."""
+    out_dir = tenant_out_dir(app, out_dir, tenant)
+    if fmt is None:
+        fmt = 'parquet' if pq is not None else 'npz'
+    if fmt == 'parquet' and pq is None:
+        raise RuntimeError('pyarrow is not installed; use --format npz')
+
+    os.makedirs(out_dir, exist_ok=True)
+    since = None if full else load_watermark(out_dir)
+    # Microseconds keep back-to-back runs apart; 'x' never overwrites a file
+    stamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+
+    rows_written = 0
+    files = []
+    newest = since
+    writer = sink = None
+
+    with tenants.use_tenant(app, tenant):
+        try:
+            for part_number, rows in enumerate(iter_chunks(since, chunk_size), start=1):
+                if fmt == 'parquet':
+                    if writer is None:
+                        schema = arrow_schema()
+                        path = os.path.join(out_dir, f'sales_{stamp}.parquet')
+                        sink = open(path, 'xb')
+                        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+                        files.append(path)
+                    writer.write_batch(to_arrow_batch(rows, schema))
+                else:
+                    path = os.path.join(out_dir, f'sales_{stamp}_part{part_number:04d}.npz')
+                    with open(path, 'xb') as f:
+                        np.savez_compressed(f, **to_numpy_columns(rows))
+                    files.append(path)
+
+                rows_written += len(rows)
+                latest = chunk_watermark(rows)
+                if latest is not None and (newest is None or latest > newest):
+                    newest = latest
+        finally:
+            if writer is not None:
+                writer.close()
+            if sink is not None:
+                sink.close()
+
+    if rows_written and newest is not None:
+        save_watermark(out_dir, newest, rows_written)
+
+    return rows_written, files
+
+
+def benchmark(app, chunk_size=5000, fmt=None, tenant=None):
+    """Time a full export against the ad-hoc ORM iteration it replaces."""
+    import tempfile
+    import tracemalloc
+
+    def measure(func):
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return rows, elapsed, peak
+
+    def orm_baseline():
+        with tenants.use_tenant(app, tenant):
+            rows = []
+            for card in Card.query.all():
+                listing = card.listing
+                order = listing.order if listing else None
+                rows.append({
+                    'card_id': card.id,
+                    'title': card.title(),
+                    'status': listing.status if listing else None,
+                    'winning_bid': listing.winning_bid if listing else None,
+                    'sale_price': order.sale_price if order else None,
+                    'paid_at': order.paid_at if order else None,
+                })
+            return len(rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            ('ORM iteration', measure(orm_baseline)),
+            ('Columnar export', measure(lambda: export_sales(app, tmp, True, chunk_size, fmt, tenant)[0])),
+        ]
+
+    print(f"{'Method':<16} | {'Rows':>8} | {'Seconds':>8} | {'Rows/s':>10} | {'Peak MB':>8}")
+    print(f"{'-' * 16}-|-{'-' * 8}-|-{'-' * 8}-|-{'-' * 10}-|-{'-' * 8}")
+    for label, (rows, elapsed, peak) in results:
+        rate = rows / elapsed if elapsed else 0
+        print(f"{label:<16} | {rows:>8} | {elapsed:>8.3f} | {rate:>10.0f} | {peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export sales history to a columnar file')
+    parser.add_argument('--full', action='store_true', help='Ignore the watermark and export everything')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per chunk (default: 5000)')
+    parser.add_argument('--out', default=EXPORT_FOLDER, help='Output directory (default: exports/)')
+    parser.add_argument('--format', choices=['parquet', 'npz'], help='Output format (default: parquet if available)')
+    parser.add_argument('--benchmark', action='store_true', help='Compare against ORM iteration instead of exporting')
+    parser.add_argument('--tenant', help='Store to export (default: the default store)')
+    parser.add_argument('--all-tenants', action='store_true', help='Export every store')
+
+    args = parser.parse_args()
+    app = create_app()
+    if not args.all_tenants:
+        tenants.check_script_tenant(parser, app, args.tenant)
+
+    if args.benchmark:
+        benchmark(app, chunk_size=args.chunk_size, fmt=args.format, tenant=args.tenant)
+        sys.exit(0)
+
+    names = [tenant.name for tenant in tenants.registry(app).all()] if args.all_tenants else [args.tenant]
+    for name in names:
+        if args.all_tenants:
+            print(f"=== Tenant: {name} ===")
+        rows, files = export_sales(app, out_dir=args.out, full=args.full,
+                                   chunk_size=args.chunk_size, fmt=args.format, tenant=name)
+        if not rows:
+            print("No changes since the last export. Nothing to write.")
+        else:
+            print(f"Exported {rows} rows to {len(files)} file(s):")
+            for path in files:
+                print(f"  {path}")
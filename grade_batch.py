@@ -0,0 +1,98 @@
+"""
+Bulk condition grading with the Message Batches API.
+
+Submits every card image that has not been graded yet as one asynchronous
+batch (split if it would exceed the batch size limits), then polls until the
+batch ends and writes each assessment back to its card. Batches cost half
+as much as one-at-a-time condition checks.
+
+Safe to interrupt: requests are recorded in the database before their batch
+is created, and the next run matches them to the batch (or submits them
+again if it was never created), then polls and collects every batch before
+submitting anything new.
+
+    python grade_batch.py              # submit ungraded cards and wait
+    python grade_batch.py --no-wait    # submit, or collect finished batches, and exit
+    python grade_batch.py --local      # use the local stand-in instead of the API
+
+Options:
+    --limit N      Grade at most N card images in this run
+    --report       Print throughput and cost for every collected batch
+    --tenant NAME  Store from tenants.json to grade (default store otherwise)
+"""
+
+import os
+import sys
+
+# Add the app directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import create_app
+from models import GradingBatch
+import tenants
+
+
+def print_report(report):
+    print(f"\n--- Batch Grading Report ---")
+    print(f"Batches: {report['batches']}  Requests: {report['requests']}  Succeeded: {report['succeeded']}")
+    print(f"Tokens: {report['input_tokens']} in / {report['output_tokens']} out")
+    print(f"Cost: ${report['batch_cost']:.4f} batched vs ${report['per_card_cost']:.4f} per-card calls")
+    if report['cards_per_hour'] is not None:
+        print(f"Throughput: {report['cards_per_hour']} cards/hour over {report['batch_seconds']}s of batch time")
+
+
+def grade_batch(app, client, limit=None, wait=True, tenant=None):
+    """Collect any finished batches, submit ungraded cards, optionally wait."""
+    from grading import poll_batches, reconcile_submissions, submit_batches
+
+    with tenants.use_tenant(app, tenant):
+        # Resume: collect batches left over from an earlier run first
+        for batch in reconcile_submissions(client):
+            print(f"Recovered batch {batch.id} from an interrupted submission")
+        running = poll_batches(client)
+        if running:
+            print(f"{len(running)} batch(es) from an earlier run still processing")
+
+        submitted = submit_batches(client, tenants.upload_folder(), limit=limit)
+        for batch in submitted:
+            print(f"Submitted batch {batch.id} with {batch.request_count} card image(s)")
+        if not submitted and not running:
+            print("No ungraded card images")
+            return
+
+        if wait:
+            print("Waiting for batches to finish...")
+            running = poll_batches(client, wait=True)
+            if running:
+                print(f"{len(running)} batch(es) still processing; run again later to collect them")
+            else:
+                print("All batches collected")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Grade ungraded card images in a Message Batch')
+    parser.add_argument('--limit', type=int, help='Grade at most N card images')
+    parser.add_argument('--no-wait', action='store_true', help='Do not wait for submitted batches to finish')
+    parser.add_argument('--local', action='store_true', help='Use the local stand-in instead of the API')
+    parser.add_argument('--report', action='store_true', help='Print throughput and cost of collected batches')
+    parser.add_argument('--tenant', help='Store to grade (default: the default store)')
+
+    args = parser.parse_args()
+    app = create_app()
+    tenants.check_script_tenant(parser, app, args.tenant)
+
+    from grading import batch_report, make_client
+    client = make_client(local=args.local)
+
+    if args.report:
+        with tenants.use_tenant(app, args.tenant):
+            print_report(batch_report(GradingBatch.query.filter_by(status='collected').all()))
+        sys.exit(0)
+
+    if client is None:
+        print("ANTHROPIC_API_KEY not configured (use --local for the stand-in)")
+        sys.exit(1)
+
+    grade_batch(app, client, limit=args.limit, wait=not args.no_wait, tenant=args.tenant)
@@ -0,0 +1,421 @@
+"""
+Card condition grading with the Anthropic API.
+
+Imported lazily by the condition route so that the Anthropic SDK only loads
+when a condition check actually runs.
+"""
+
+import base64
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import anthropic
+
+import events
+import metrics
+from condition_results import (TOOL_NAME, ConditionResultError, condition_tool, format_result,
+                               save_result, validate_result)
+
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 500
+
+# Retry logic: 3 attempts with 3 seconds between each
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 3
+
+
+def image_media_type(filename):
+    """Determine the media type from the file extension."""
+    ext = filename.rsplit('.', 1)[1].lower()
+    media_type = 'image/jpeg' if ext in ('jpg', 'jpeg') else f'image/{ext}'
+    if ext in ('tif', 'tiff'):
+        media_type = 'image/tiff'
+    return media_type
+
+
+def build_condition_prompt(card_type, side, selected_condition):
+    """Build the condition assessment prompt based on card type."""
+    if card_type == 'sports':
+        condition_scale = "NM (Near Mint), EX (Excellent), VG (Very Good), G (Good), P (Poor)"
+    else:
+        condition_scale = "NM (Near Mint), LP (Lightly Played), MP (Moderately Played), HP (Heavily Played), DMG (Damaged)"
+
+    return f"""Analyze this {card_type} trading card image ({side} of card) for condition assessment.
+
+The seller has selected condition: {selected_condition if selected_condition else 'not yet selected'}
+
+Using the standard condition scale for {card_type} cards: {condition_scale}
+
+Please assess:
+1. Corners - any whitening, dings, or wear?
+2. Edges - any whitening, chipping, or roughness?
+3. Surface - any scratches, print defects, staining, or creases?
+4. Centering - estimate the centering (e.g., 60/40, 55/45)
+
+Then provide:
+- Your estimated condition grade
+- If the seller's selected condition seems accurate, too generous, or too conservative
+- Any specific issues a buyer might notice
+
+Record your assessment with the {TOOL_NAME} tool. Be concise and direct. Focus on what matters for selling."""
+
+
+def build_condition_messages(filepath, filename, card_type, side, selected_condition):
+    """Read and encode the image and build the messages payload."""
+    with open(filepath, 'rb') as f:
+        image_data = base64.standard_b64encode(f.read()).decode('utf-8')
+
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": image_media_type(filename),
+                        "data": image_data
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": build_condition_prompt(card_type, side, selected_condition)
+                }
+            ]
+        }
+    ]
+
+
+def build_condition_params(messages, card_type):
+    """Request parameters that force the assessment through the condition tool."""
+    return {
+        'model': MODEL,
+        'max_tokens': MAX_TOKENS,
+        'messages': messages,
+        'tools': [condition_tool(card_type)],
+        'tool_choice': {'type': 'tool', 'name': TOOL_NAME},
+    }
+
+
+def parse_condition_message(message, card_type):
+    """Pull the condition tool call out of a response and validate it."""
+    for block in message.content:
+        if block.type == 'tool_use' and block.name == TOOL_NAME:
+            return validate_result(block.input, card_type)
+    raise ConditionResultError('Response has no condition result')
+
+
+def check_card_condition(api_key, filepath, filename, card_type, side, selected_condition):
+    """
+    Ask the model for a structured condition assessment of one card image.
+    Retries up to MAX_ATTEMPTS times (including invalid results) and
+    re-raises the last error. Returns the validated result dict.
+    """
+    params = build_condition_params(
+        build_condition_messages(filepath, filename, card_type, side, selected_condition), card_type)
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            if attempt > 0:
+                metrics.RETRIES.inc('anthropic_messages_create')
+            client = anthropic.Anthropic(api_key=api_key)
+            with metrics.timed('anthropic_messages_create'):
+                response = client.messages.create(**params)
+            return parse_condition_message(response, card_type)
+
+        except Exception:
+            if attempt < MAX_ATTEMPTS - 1:
+                time.sleep(RETRY_DELAY)  # Wait before retrying
+            else:
+                raise
+
+
+# --- Batch grading (Message Batches API) ---
+
+# Standard prices for MODEL in USD per million tokens; batches cost half
+PRICE_PER_MTOK = {'input': 3.00, 'output': 15.00}
+BATCH_DISCOUNT = 0.5
+
+MAX_BATCH_BYTES = 200 * 1024 * 1024  # Stay under the 256MB batch size limit
+MAX_BATCH_REQUESTS = 10000
+
+POLL_INITIAL_DELAY = 5
+POLL_MAX_DELAY = 120
+SUBMITTING_STALE_AFTER = timedelta(hours=1)  # A batches.create call still in flight is younger than this
+CLOCK_SKEW = timedelta(minutes=5)  # Allowed difference between the API's clock and ours
+
+LOCAL_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_batches')
+
+
+def make_client(local=False):
+    """
+    An Anthropic client, or the local stand-in from grading_local.py.
+    Returns None if no API key is configured.
+    """
+    if local:
+        from grading_local import LocalClient
+        return LocalClient(batch_seconds=10, state_dir=LOCAL_STATE_DIR)
+
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    if not api_key:
+        return None
+    return anthropic.Anthropic(api_key=api_key)
+
+
+def find_ungraded(limit=None):
+    """
+    Return (card, side, image) for every card image without a submitted,
+    pending or successful grading request, oldest cards first.
+    """
+    from models import Card, GradingRequest
+
+    done = {
+        (card_id, side)
+        for card_id, side in GradingRequest.query
+        .filter(GradingRequest.status.in_(('submitting', 'pending', 'succeeded')))
+        .with_entities(GradingRequest.card_id, GradingRequest.side)
+    }
+
+    ungraded = []
+    for card in Card.query.order_by(Card.id):
+        for side, image in (('front', card.image_front), ('back', card.image_back)):
+            if image and (card.id, side) not in done:
+                ungraded.append((card, side, image))
+                if limit is not None and len(ungraded) >= limit:
+                    return ungraded
+    return ungraded
+
+
+def submit_batches(client, upload_folder, limit=None):
+    """
+    Submit every ungraded card image as Message Batches, splitting to stay
+    under the batch size limits. Returns the GradingBatch rows created.
+
+    Each batch's requests are committed as 'submitting' before the batch is
+    created, so a run interrupted mid-call leaves rows that
+    reconcile_submissions() can match to the batch instead of paying for
+    the same cards twice. If the API rejects the call, they are deleted and
+    the error re-raised.
+    """
+    from models import db, GradingBatch, GradingRequest
+
+    pending = find_ungraded(limit)
+    batches = []
+
+    while pending:
+        requests, graded, size = [], [], 0
+        submission = uuid.uuid4().hex[:12]
+        while pending and len(requests) < MAX_BATCH_REQUESTS:
+            card, side, image = pending[0]
+            filepath = os.path.join(upload_folder, image)
+            if not os.path.exists(filepath):
+                pending.pop(0)
+                continue
+            messages = build_condition_messages(filepath, image, card.card_type, side, card.condition_display())
+            request_bytes = len(messages[0]['content'][0]['source']['data']) + 4096
+            if requests and size + request_bytes > MAX_BATCH_BYTES:
+                break
+            pending.pop(0)
+            size += request_bytes
+            row = GradingRequest(card_id=card.id, side=side, image=image, submission=submission,
+                                 status='submitting')
+            requests.append({
+                'custom_id': row.custom_id(),
+                'params': build_condition_params(messages, card.card_type),
+            })
+            graded.append(row)
+
+        if not requests:
+            break
+
+        db.session.add_all(graded)
+        db.session.commit()
+
+        try:
+            with metrics.timed('anthropic_batches_create'):
+                created = client.messages.batches.create(requests=requests)
+        except anthropic.APIStatusError:
+            # The API answered with an error, so no batch exists: free the images now
+            for row in graded:
+                db.session.delete(row)
+            db.session.commit()
+            raise
+
+        batch = GradingBatch(id=created.id, request_count=len(requests))
+        db.session.add(batch)
+        for row in graded:
+            row.batch_id = created.id
+            row.status = 'pending'
+        db.session.commit()
+        batches.append(batch)
+
+    return batches
+
+
+def _naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def reconcile_submissions(client, stale_after=SUBMITTING_STALE_AFTER):
+    """
+    Resolve requests left 'submitting' by an interrupted submit_batches().
+
+    Batches created since then that no store has recorded are matched to
+    those requests by custom_id once they end, and recorded so that
+    poll_batches() collects them. Requests no batch contains are deleted,
+    so the next submission picks their card images up again. While such a
+    batch is still processing the requests are left alone (they keep their
+    images from being submitted again); run again later.
+    Returns the GradingBatch rows recorded.
+    """
+    from models import db, GradingBatch, GradingRequest
+
+    stale = GradingRequest.query.filter(
+        GradingRequest.status == 'submitting',
+        GradingRequest.queued_at <= datetime.utcnow() - stale_after,
+    ).all()
+    if not stale:
+        return []
+
+    by_custom_id = {row.custom_id(): row for row in stale}
+    since = min(row.queued_at for row in stale) - CLOCK_SKEW
+    known = {batch_id for (batch_id,) in GradingBatch.query.with_entities(GradingBatch.id)}
+    recorded, processing = [], False
+
+    for remote in client.messages.batches.list(limit=100):  # Newest first
+        created_at = _naive_utc(remote.created_at)
+        if created_at < since:
+            break
+        if remote.id in known:
+            continue
+        if remote.processing_status != 'ended':
+            processing = True  # Its requests aren't visible until it ends
+            continue
+        matched = [by_custom_id.pop(entry.custom_id)
+                   for entry in client.messages.batches.results(remote.id)
+                   if entry.custom_id in by_custom_id]
+        if not matched:
+            continue  # Another store's batch
+        batch = GradingBatch(id=remote.id, request_count=len(matched), submitted_at=created_at)
+        db.session.add(batch)
+        for row in matched:
+            row.batch_id = remote.id
+            row.status = 'pending'
+        recorded.append(batch)
+
+    if not processing:
+        for row in by_custom_id.values():
+            db.session.delete(row)
+    db.session.commit()
+    return recorded
+
+
+def collect_batch(client, batch):
+    """Write the results of an ended batch back to its grading requests."""
+    from models import db
+
+    by_custom_id = {row.custom_id(): row for row in batch.requests}
+    now = datetime.utcnow()
+
+    for entry in client.messages.batches.results(batch.id):
+        row = by_custom_id.get(entry.custom_id)
+        if row is None:
+            continue
+        result = entry.result
+        row.status = result.type
+        row.completed_at = now
+        if result.type == 'succeeded':
+            row.input_tokens = result.message.usage.input_tokens
+            row.output_tokens = result.message.usage.output_tokens
+            try:
+                condition = parse_condition_message(result.message, row.card.card_type)
+            except ConditionResultError as e:
+                # Invalid results are resubmitted by the next run
+                row.status = 'errored'
+                row.error = str(e)
+                continue
+            row.assessment = format_result(condition)
+            save_result(condition, row.image, row.side, row.card.card_type, card=row.card, source='batch')
+        elif result.type == 'errored':
+            row.error = str(result.error)
+
+    # Anything the API did not return is retried on the next submission
+    for row in batch.requests:
+        if row.status == 'pending':
+            row.status = 'expired'
+
+    batch.status = 'collected'
+    batch.collected_at = now
+    db.session.commit()
+
+    statuses = [row.status for row in batch.requests]
+    events.publish('grading', {
+        'batch_id': batch.id,
+        'succeeded': statuses.count('succeeded'),
+        'errored': len(statuses) - statuses.count('succeeded'),
+    })
+
+
+def poll_batches(client, wait=False, max_wait=24 * 3600, sleep=time.sleep):
+    """
+    Check every in-progress batch and collect the ones that have ended.
+    With wait=True, keep polling with exponential backoff until all batches
+    have ended or max_wait seconds pass. Returns the batches still running.
+    """
+    from models import db, GradingBatch
+
+    delay = POLL_INITIAL_DELAY
+    waited = 0
+
+    while True:
+        running = GradingBatch.query.filter(GradingBatch.status.in_(('in_progress', 'ended'))).all()
+        still_running = []
+        for batch in running:
+            if batch.status == 'in_progress':
+                remote = client.messages.batches.retrieve(batch.id)
+                if remote.processing_status != 'ended':
+                    still_running.append(batch)
+                    continue
+                batch.status = 'ended'
+                batch.ended_at = getattr(remote, 'ended_at', None) or datetime.utcnow()
+                db.session.commit()
+            collect_batch(client, batch)
+
+        if not still_running or not wait or waited >= max_wait:
+            return still_running
+
+        sleep(delay)
+        waited += delay
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def batch_report(batches):
+    """
+    Summarise throughput and cost of collected batches against running the
+    same requests one at a time at standard prices.
+    """
+    succeeded = [row for batch in batches for row in batch.requests if row.status == 'succeeded']
+    input_tokens = sum(row.input_tokens or 0 for row in succeeded)
+    output_tokens = sum(row.output_tokens or 0 for row in succeeded)
+    standard_cost = (input_tokens * PRICE_PER_MTOK['input'] + output_tokens * PRICE_PER_MTOK['output']) / 1e6
+
+    elapsed = sum(
+        ((batch.ended_at or batch.collected_at) - batch.submitted_at).total_seconds()
+        for batch in batches if (batch.ended_at or batch.collected_at)
+    )
+
+    return {
+        'batches': len(batches),
+        'requests': sum(batch.request_count or 0 for batch in batches),
+        'succeeded': len(succeeded),
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'batch_cost': round(standard_cost * BATCH_DISCOUNT, 4),
+        'per_card_cost': round(standard_cost, 4),
+        'batch_seconds': round(elapsed, 1),
+        'cards_per_hour': round(len(succeeded) / elapsed * 3600, 1) if elapsed else None,
+    }
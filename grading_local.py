@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Anthropic Messages and Message Batches APIs.
+
+Used by grade_batch.py --local and bench.py to exercise batch grading
+without network access or API charges. Responses are canned condition
+tool calls, token counts are estimated from the request size, and calls
+sleep for a configurable latency so throughput can be compared.
+
+Batch state is kept in memory, or in JSON files under state_dir so that a
+later run (e.g. after an interruption) can resume polling the same batches.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+IMAGE_TOKENS = 1600  # Roughly what a downscaled card scan costs
+OUTPUT_TOKENS = 180
+
+CONDITION = {
+    'corners': 'Light whitening on one corner.',
+    'edges': 'Clean, no chipping.',
+    'surface': 'No visible scratches or creases.',
+    'centering': '55/45',
+}
+
+
+def _usage(messages):
+    text = ''.join(
+        block.get('text', '')
+        for message in messages for block in message['content']
+    )
+    images = sum(
+        1 for message in messages for block in message['content'] if block['type'] == 'image'
+    )
+    return SimpleNamespace(input_tokens=images * IMAGE_TOKENS + len(text) // 4, output_tokens=OUTPUT_TOKENS)
+
+
+def _content(messages, tools):
+    """A canned tool call (or text) agreeing with the seller's condition."""
+    text = messages[0]['content'][-1]['text']
+    selected = text.split('The seller has selected condition: ', 1)[-1].split('\n', 1)[0]
+    if not tools:
+        return [{'type': 'text', 'text': f"Estimated grade: {selected}"}]
+    grades = tools[0]['input_schema']['properties']['estimated_grade']['enum']
+    grade = selected if selected in grades else grades[0]
+    condition = dict(CONDITION, estimated_grade=grade, seller_grade='accurate')
+    return [{'type': 'tool_use', 'id': f"toolu_local_{uuid.uuid4().hex[:16]}",
+             'name': tools[0]['name'], 'input': condition}]
+
+
+def _message(content, input_tokens, output_tokens):
+    return SimpleNamespace(
+        content=[SimpleNamespace(**block) for block in content],
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens),
+    )
+
+
+class _Messages:
+    def __init__(self, client):
+        self._client = client
+        self.batches = _Batches(client)
+
+    def create(self, model, max_tokens, messages, tools=None, **kwargs):
+        time.sleep(self._client.call_latency)
+        usage = _usage(messages)
+        return _message(_content(messages, tools), usage.input_tokens, usage.output_tokens)
+
+
+class _Batches:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, requests):
+        batch_id = f"msgbatch_local_{uuid.uuid4().hex[:24]}"
+        results = []
+        for request in requests:
+            params = request['params']
+            usage = _usage(params['messages'])
+            results.append({
+                'custom_id': request['custom_id'],
+                'content': _content(params['messages'], params.get('tools')),
+                'input_tokens': usage.input_tokens,
+                'output_tokens': usage.output_tokens,
+            })
+        self._client._save(batch_id, {
+            'created': time.time(),
+            'ends': time.time() + self._client.batch_seconds,
+            'results': results,
+        })
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id):
+        state = self._client._load(batch_id)
+        ended = time.time() >= state['ends']
+        return SimpleNamespace(
+            id=batch_id,
+            created_at=datetime.fromtimestamp(state['created'], timezone.utc),
+            processing_status='ended' if ended else 'in_progress',
+            ended_at=None,
+        )
+
+    def list(self, limit=20):
+        """Every batch, newest first (the API pages through them the same way)."""
+        batches = [self.retrieve(batch_id) for batch_id in self._client._batch_ids()]
+        return sorted(batches, key=lambda batch: batch.created_at, reverse=True)
+
+    def results(self, batch_id):
+        state = self._client._load(batch_id)
+        for result in state['results']:
+            message = _message(result['content'], result['input_tokens'], result['output_tokens'])
+            yield SimpleNamespace(
+                custom_id=result['custom_id'],
+                result=SimpleNamespace(type='succeeded', message=message),
+            )
+
+
+class LocalClient:
+    """Drop-in for anthropic.Anthropic() covering the calls grading.py makes."""
+
+    def __init__(self, call_latency=0.0, batch_seconds=0.0, state_dir=None):
+        self.call_latency = call_latency
+        self.batch_seconds = batch_seconds
+        self.state_dir = state_dir
+        self._batches = {}
+        self.messages = _Messages(self)
+
+    def _save(self, batch_id, state):
+        if self.state_dir is None:
+            self._batches[batch_id] = state
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(os.path.join(self.state_dir, f"{batch_id}.json"), 'w') as f:
+            json.dump(state, f)
+
+    def _batch_ids(self):
+        if self.state_dir is None:
+            return list(self._batches)
+        if not os.path.isdir(self.state_dir):
+            return []
+        return [name[:-5] for name in os.listdir(self.state_dir) if name.endswith('.json')]
+
+    def _load(self, batch_id):
+        if self.state_dir is None:
+            return self._batches[batch_id]
+        with open(os.path.join(self.state_dir, f"{batch_id}.json"), 'r') as f:
+            return json.load(f)
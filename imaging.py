@@ -0,0 +1,317 @@
+"""
+Image processing for card scans.
+
+Imported lazily by the upload routes so that OpenCV only loads when a scan
+is actually processed.
+
+Every upload first goes through a quality gate (check_scan) that looks at a
+small grayscale view of the scan: blur, skew, DPI and where the card sits
+on the scanner bed. Unusable scans are rejected before they are stored or
+sent for grading; fixable ones are deskewed, rescaled and re-anchored by
+auto_crop_card.
+"""
+
+import struct
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+import metrics
+
+SCAN_DPI = 600
+CARD_WIDTH_IN = 2.5
+CARD_HEIGHT_IN = 3.5
+
+# Sleeve margins around the card (mm): the crop assumes the sleeve is flush
+# to the top-left corner, which puts the card this far in
+SLEEVE_LEFT_MM = 3
+SLEEVE_RIGHT_MM = 3
+SLEEVE_TOP_MM = 5
+SLEEVE_BOTTOM_MM = 3
+
+ANALYSIS_WIDTH = 480  # px; the gate never looks at the full-resolution scan
+
+# Quality thresholds
+MIN_BLUR_VARIANCE = 60.0     # Laplacian variance of the card on the analysis view
+MAX_SKEW_DEGREES = 8.0       # Beyond this the card is too crooked to fix
+DESKEW_DEGREES = 0.4         # Rotate when skewed more than this
+MIN_DPI = 300
+DPI_TOLERANCE = 0.03         # Rescale when more than 3% off SCAN_DPI
+PLACEMENT_TOLERANCE_MM = 1.5  # Re-anchor when the card is further off than this
+
+# Transform auto_crop_card applies before cropping. Coordinates are fractions
+# of the image size so they hold at any resolution.
+ScanPlan = namedtuple('ScanPlan', ['scale', 'angle', 'center', 'card_size'])
+
+
+class ScanRejected(Exception):
+    """Raised when a scan fails the quality gate; carries the measurements."""
+
+    def __init__(self, message, quality):
+        super().__init__(message)
+        self.quality = quality
+
+
+TIFF_X_RESOLUTION = 282
+TIFF_RESOLUTION_UNIT = 296  # 1 = none, 2 = inch (the default), 3 = centimetre
+
+
+def read_dpi(filepath):
+    """DPI recorded in a JPEG (JFIF), PNG (pHYs) or TIFF header, or None."""
+    with open(filepath, 'rb') as f:
+        header = f.read(64 * 1024)
+
+    if header[:2] == b'\xff\xd8' and header[6:11] == b'JFIF\x00':
+        units, x_density = header[13], struct.unpack('>H', header[14:16])[0]
+        if units == 1:
+            return x_density
+        if units == 2:
+            return round(x_density * 2.54)
+        return None
+
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        index = header.find(b'pHYs')
+        if index != -1:
+            x_ppu, _, unit = struct.unpack('>IIB', header[index + 4:index + 13])
+            if unit == 1:
+                return round(x_ppu * 0.0254)
+        return None
+
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        from PIL import Image  # Only needed for TIFFs
+
+        with Image.open(filepath) as image:  # Reads the tags, not the pixels
+            x_resolution = image.tag_v2.get(TIFF_X_RESOLUTION)
+            unit = image.tag_v2.get(TIFF_RESOLUTION_UNIT, 2)
+        if x_resolution:
+            if unit == 2:
+                return round(float(x_resolution))
+            if unit == 3:
+                return round(float(x_resolution) * 2.54)
+    return None
+
+
+def _image_width(filepath):
+    """Pixel width from a JPEG or PNG header, without decoding the image."""
+    with open(filepath, 'rb') as f:
+        data = f.read(256 * 1024)
+
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>I', data[16:20])[0]
+    if data[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 < len(data) and data[i] == 0xFF:
+            marker = data[i + 1]
+            if marker in (0xC0, 0xC1, 0xC2):  # Start of frame
+                return struct.unpack('>H', data[i + 7:i + 9])[0]
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def _analysis_view(filepath):
+    """
+    Small grayscale view of a scan and the number of full-resolution pixels
+    per view pixel.
+    """
+    # JPEGs decode straight to a quarter-size image, which is most of the win
+    small = cv2.imread(filepath, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if small is None:
+        return None, None
+    full_width = _image_width(filepath) or small.shape[1] * 4
+
+    if small.shape[1] > ANALYSIS_WIDTH:
+        height = round(small.shape[0] * ANALYSIS_WIDTH / small.shape[1])
+        small = cv2.resize(small, (ANALYSIS_WIDTH, height), interpolation=cv2.INTER_AREA)
+    return small, full_width / small.shape[1]
+
+
+def _card_mask(gray):
+    """Pixels darker than the scanner bed (Otsu threshold), small gaps closed."""
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+
+
+def _find_card(mask):
+    """Centre and (width, height) of the card's minAreaRect, or None."""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    (cx, cy), (w, h), _ = cv2.minAreaRect(max(contours, key=cv2.contourArea))
+    if w > h:
+        w, h = h, w
+    aspect = w / h if h else 0
+    if w * h < 0.2 * mask.size or abs(aspect - CARD_WIDTH_IN / CARD_HEIGHT_IN) > 0.1:
+        return None  # White-bordered cards can blend into the bed
+    return (cx, cy), (w, h)
+
+
+def _measure_skew(mask):
+    """
+    Median deviation of the strong straight edges from the image axes, in
+    degrees. Lines come from the outline of the card mask rather than every
+    edge in the artwork, and only angles near the axes are searched, which
+    keeps the Hough transform to a few milliseconds.
+    """
+    edges = cv2.Canny(mask, 50, 150)
+    limit = np.radians(MAX_SKEW_DEGREES * 2)
+    # Vertical lines sit near 0/180 degrees, horizontal ones near 90
+    ranges = ((0, limit, 0), (np.pi - limit, np.pi, 180), (np.pi / 2 - limit, np.pi / 2 + limit, 90))
+
+    deviations = []
+    for min_theta, max_theta, axis in ranges:
+        lines = cv2.HoughLines(edges, 1, np.pi / 720, threshold=max(mask.shape) // 4,
+                               min_theta=min_theta, max_theta=max_theta)
+        if lines is not None:
+            deviations.append(np.degrees(lines[:20, 0, 1]) - axis)
+    if not deviations:
+        return 0.0
+    return float(np.median(np.concatenate(deviations)))
+
+
+@metrics.timed_function('check_scan')
+def check_scan(filepath):
+    """
+    Run the quality gate on a scan. Returns (quality, plan): the measurements
+    and corrections for the upload JSON, and the ScanPlan for auto_crop_card.
+    Raises ScanRejected for scans that cannot be fixed.
+    """
+    start = time.perf_counter()
+    gray, px_per_view = _analysis_view(filepath)
+    if gray is None:
+        raise ScanRejected('Scan could not be read as an image', {'readable': False})
+
+    decoded = time.perf_counter()
+    height, width = gray.shape
+    quality = {'readable': True, 'corrections': []}
+
+    mask = _card_mask(gray)
+    card = _find_card(mask)
+    quality['card_found'] = card is not None
+    region = gray
+    if card is not None:
+        (cx, cy), (w, h) = card
+        region = gray[max(int(cy - h / 2), 0):int(cy + h / 2), max(int(cx - w / 2), 0):int(cx + w / 2)]
+
+    quality['blur'] = round(float(cv2.Laplacian(region, cv2.CV_64F).var()), 1)
+    quality['skew_degrees'] = round(_measure_skew(mask), 2)
+
+    # DPI: the card's measured size, unless the header agrees with it (many
+    # tools write a 72 DPI default). An unverified low header is ignored.
+    header_dpi = read_dpi(filepath)
+    size_dpi = None
+    if card is not None:
+        size_dpi = round((w / CARD_WIDTH_IN + h / CARD_HEIGHT_IN) / 2 * px_per_view)
+    if header_dpi and (abs(header_dpi - size_dpi) <= size_dpi * DPI_TOLERANCE if size_dpi
+                       else header_dpi >= MIN_DPI):
+        dpi, quality['dpi_source'] = header_dpi, 'metadata'
+    elif size_dpi:
+        dpi, quality['dpi_source'] = size_dpi, 'size'
+    else:
+        dpi, quality['dpi_source'] = SCAN_DPI, 'assumed'
+    quality['dpi'] = dpi
+    quality['header_dpi'] = header_dpi
+
+    scale = 1.0
+    if abs(dpi - SCAN_DPI) > SCAN_DPI * DPI_TOLERANCE:
+        scale = SCAN_DPI / dpi
+        quality['corrections'].append('rescale')
+
+    angle = 0.0
+    if abs(quality['skew_degrees']) > DESKEW_DEGREES:
+        angle = quality['skew_degrees']
+        quality['corrections'].append('deskew')
+
+    center = card_size = None
+    quality['offset_mm'] = None
+    if card is not None:
+        # Where the card's top-left corner is vs. where a flush sleeve puts it
+        mm_per_px = 25.4 / dpi * px_per_view
+        offset_x = (cx - w / 2) * mm_per_px - SLEEVE_LEFT_MM
+        offset_y = (cy - h / 2) * mm_per_px - SLEEVE_TOP_MM
+        quality['offset_mm'] = [round(offset_x, 1), round(offset_y, 1)]
+        if max(abs(offset_x), abs(offset_y)) > PLACEMENT_TOLERANCE_MM or angle:
+            center = (cx / width, cy / height)
+            card_size = (w / width, h / height)
+            if max(abs(offset_x), abs(offset_y)) > PLACEMENT_TOLERANCE_MM:
+                quality['corrections'].append('re-anchor')
+
+    quality['decode_ms'] = round((decoded - start) * 1000, 1)
+    quality['analysis_ms'] = round((time.perf_counter() - decoded) * 1000, 1)
+
+    rejection = None
+    if quality['blur'] < MIN_BLUR_VARIANCE:
+        rejection = 'Scan is too blurry; rescan with the lid closed'
+    elif abs(quality['skew_degrees']) > MAX_SKEW_DEGREES:
+        rejection = 'Card is too crooked; straighten it on the scanner bed'
+    elif dpi < MIN_DPI:
+        rejection = f'Scan resolution is {dpi} DPI; scan at {SCAN_DPI} DPI'
+    if rejection:
+        quality['corrections'] = []
+        raise ScanRejected(rejection, quality)
+
+    return quality, ScanPlan(scale, angle, center, card_size)
+
+
+@metrics.timed_function('auto_crop_card')
+def auto_crop_card(filepath, plan=None):
+    """
+    Crop a trading card scan to fixed dimensions.
+    Assumes card in penny sleeve is flush to top-left corner at 600 DPI,
+    after applying the rescale/deskew/re-anchor from check_scan's plan.
+
+    Card: 2.5" x 3.5" = 1500 x 2100 pixels at 600 DPI
+    Penny sleeve adds: 3mm left, 3mm right, 5mm top, 3mm bottom
+    At 600 DPI: 1mm = 23.62 pixels
+    """
+    # Read image with OpenCV
+    img = cv2.imread(filepath)
+    if img is None:
+        return filepath
+
+    # Dimensions at 600 DPI
+    mm_to_px = SCAN_DPI / 25.4  # ~23.62 pixels per mm
+
+    card_width = int(CARD_WIDTH_IN * SCAN_DPI)    # 1500px
+    card_height = int(CARD_HEIGHT_IN * SCAN_DPI)  # 2100px
+
+    sleeve_left = int(SLEEVE_LEFT_MM * mm_to_px)      # ~71px
+    sleeve_right = int(SLEEVE_RIGHT_MM * mm_to_px)    # ~71px
+    sleeve_top = int(SLEEVE_TOP_MM * mm_to_px)        # ~118px
+    sleeve_bottom = int(SLEEVE_BOTTOM_MM * mm_to_px)  # ~71px
+
+    cushion = 5  # 5px extra border
+
+    left = top = 0
+    if plan is not None:
+        height, width = img.shape[:2]
+        cx, cy = (plan.center[0] * width, plan.center[1] * height) if plan.center else (width / 2, height / 2)
+
+        if plan.scale != 1.0 or plan.angle:
+            # Rotate about the card centre and rescale to 600 DPI in one pass
+            matrix = cv2.getRotationMatrix2D((cx, cy), plan.angle, plan.scale)
+            matrix[:, 2] += (cx * (plan.scale - 1), cy * (plan.scale - 1))
+            size = (round(width * plan.scale), round(height * plan.scale))
+            img = cv2.warpAffine(img, matrix, size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            cx, cy = cx * plan.scale, cy * plan.scale
+
+        if plan.card_size:
+            # Re-anchor: put the crop where the sleeve actually is
+            found_width = plan.card_size[0] * width * plan.scale
+            found_height = plan.card_size[1] * height * plan.scale
+            left = max(int(cx - found_width / 2) - sleeve_left, 0)
+            top = max(int(cy - found_height / 2) - sleeve_top, 0)
+
+    # Total crop dimensions (sleeved card + cushion on right/bottom only since flush to corner)
+    crop_width = sleeve_left + card_width + sleeve_right + cushion
+    crop_height = sleeve_top + card_height + sleeve_bottom + cushion
+
+    # Crop from the sleeve's top-left corner, within the image bounds
+    cropped = img[top:top + crop_height, left:left + crop_width]
+
+    # Save the cropped image
+    cv2.imwrite(filepath, cropped)
+
+    return filepath
@@ -0,0 +1,35 @@
+"""
+Drop in-process caches when a session commits changes.
+
+One set of session hooks notes that a flush wrote something and, once the
+transaction commits, calls every callback registered with on_commit()
+(the read models and the render cache). A rollback forgets the flush.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_callbacks = []
+
+
+def on_commit(callback):
+    """Call `callback()` after every commit that changed rows. Usable as a decorator."""
+    _callbacks.append(callback)
+    return callback
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_dirty(session, flush_context):
+    session.info['caches_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('caches_dirty', False):
+        for callback in _callbacks:
+            callback()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_dirty(session):
+    session.info.pop('caches_dirty', None)
@@ -0,0 +1,288 @@
+"""
+Request-level performance instrumentation.
+
+Collects per-request timings, SQL query counts/time, template render time and
+timers around slow operations (image crop, Anthropic calls, settings reads),
+and exposes them as Prometheus histograms at /metrics.
+
+Optional sampling profiler: set PROFILE_SAMPLING=1 to sample request threads
+and collect folded stacks per endpoint (flamegraph.pl / speedscope format).
+View them at /metrics/profile?endpoint=<name>; they are also written to
+profiles/<endpoint>.folded on exit.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+PROFILE_FOLDER = os.path.join(os.path.dirname(__file__), 'profiles')
+
+
+class Histogram:
+    """Minimal thread-safe Prometheus histogram with labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labelvalues, counts, total, count in snapshot:
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labelnames, labelvalues))
+            prefix = f"{labels}," if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    """Minimal thread-safe Prometheus counter with labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labelvalues, value in snapshot:
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labelnames, labelvalues))
+            lines.append(f"{self.name}{{{labels}}} {value:g}" if labels else f"{self.name} {value:g}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram('ebaysales_request_seconds', 'Time spent handling a request.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram('ebaysales_request_queries', 'SQL queries executed per request.',
+                            ('endpoint',), buckets=COUNT_BUCKETS)
+REQUEST_QUERY_SECONDS = Histogram('ebaysales_request_query_seconds', 'Total SQL time per request.',
+                                  ('endpoint',))
+TEMPLATE_SECONDS = Histogram('ebaysales_template_render_seconds', 'Time spent rendering a template.',
+                             ('template',))
+OPERATION_SECONDS = Histogram('ebaysales_operation_seconds', 'Time spent in instrumented operations.',
+                              ('operation', 'outcome'))
+RETRIES = Counter('ebaysales_retries_total', 'Retried attempts of instrumented operations.', ('operation',))
+RENDER_CACHE = Counter('ebaysales_render_cache_total', 'Render cache outcomes (hit, miss, not_modified).',
+                       ('page', 'outcome'))
+
+REGISTRY = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_QUERY_SECONDS, TEMPLATE_SECONDS,
+            OPERATION_SECONDS, RETRIES, RENDER_CACHE]
+
+
+@contextmanager
+def timed(operation):
+    """Time a block of code into ebaysales_operation_seconds."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        OPERATION_SECONDS.observe(time.perf_counter() - start, operation, outcome)
+
+
+def timed_function(operation):
+    """Decorator form of timed()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """Render every registered metric in Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- SQLAlchemy hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        stats = g.get('metrics_sql')
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - context.metrics_start
+
+
+# --- Template hooks ---
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.metrics_template_start = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    start = g.pop('metrics_template_start', None) if has_request_context() else None
+    if start is not None:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - start, template.name or 'string')
+
+
+# --- Sampling profiler ---
+
+class SamplingProfiler:
+    """Samples the stacks of threads currently serving a request.
+
+    Stacks are aggregated per endpoint in folded format ("a;b;c count"), ready
+    for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.active = {}  # thread id -> endpoint
+        self.stacks = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            atexit.register(self.dump)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, endpoint in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self.stacks[endpoint][';'.join(reversed(stack))] += 1
+
+    def folded(self, endpoint):
+        with self._lock:
+            samples = dict(self.stacks.get(endpoint, {}))
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(samples.items()))
+
+    def dump(self, folder=PROFILE_FOLDER):
+        with self._lock:
+            endpoints = list(self.stacks)
+        if not endpoints:
+            return
+        os.makedirs(folder, exist_ok=True)
+        for endpoint in endpoints:
+            with open(os.path.join(folder, f"{endpoint}.folded"), 'w') as f:
+                f.write(self.folded(endpoint))
+
+
+profiler = SamplingProfiler()
+
+
+# --- Flask wiring ---
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql = [0, 0.0]  # query count, query seconds
+    if profiler._thread is not None:
+        profiler.active[threading.get_ident()] = request.endpoint or 'unknown'
+
+
+def _after_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, request.method, response.status_code)
+    query_count, query_seconds = g.metrics_sql
+    REQUEST_QUERIES.observe(query_count, endpoint)
+    REQUEST_QUERY_SECONDS.observe(query_seconds, endpoint)
+    return response
+
+
+def _teardown_request(exc):
+    profiler.active.pop(threading.get_ident(), None)
+
+
+def metrics_endpoint():
+    """Expose collected metrics in Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def profile_endpoint():
+    """Return folded stacks for one endpoint (or the list of sampled endpoints)."""
+    endpoint = request.args.get('endpoint')
+    if not endpoint:
+        return Response(''.join(f"{name}\n" for name in sorted(profiler.stacks)), mimetype='text/plain')
+    return Response(profiler.folded(endpoint), mimetype='text/plain')
+
+
+def init_app(app):
+    """Attach instrumentation hooks and the /metrics endpoint to a Flask app."""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_template_rendered, app)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+    app.add_url_rule('/metrics/profile', 'metrics_profile', profile_endpoint)
+
+    if app.config.get('PROFILE_SAMPLING', os.getenv('PROFILE_SAMPLING') == '1'):
+        profiler.start()
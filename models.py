@@ -1,33 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
-db = SQLAlchemy()
+from tenants import TenantSession
 
-class Card(db.Model):
-    __tablename__ = 'cards'
-    __table_args__ = {'sqlite_autoincrement': True}
+db = SQLAlchemy(session_options={'class_': TenantSession})  # Sessions use the request's tenant engine
 
-    id = db.Column(db.Integer, primary_key=True)
-    card_type = db.Column(db.String(20), nullable=False)  # 'sports', 'mtg', 'pokemon'
-    name = db.Column(db.String(200))  # Additional details - optional
-    set_name = db.Column(db.String(100))  # Set or year
-    card_number = db.Column(db.String(50))  # Card number in set
-    player_name = db.Column(db.String(100))  # For sports cards
-    year = db.Column(db.String(10))  # For sports cards
-    condition = db.Column(db.String(20), nullable=False)  # NM, LP, PSA 9, etc.
-    is_graded = db.Column(db.Boolean, default=False)
-    grading_company = db.Column(db.String(20))  # PSA, BGS, SGC
-    grade = db.Column(db.String(10))  # 9, 9.5, 10, etc.
-    quantity = db.Column(db.Integer, default=1)  # 1x, 2x, 3x, 4x
-    starting_bid = db.Column(db.Float, default=0.50)
-    notes = db.Column(db.Text)  # Public notes - shown in auction description
-    private_notes = db.Column(db.Text)  # Private notes - internal use only
-    foil = db.Column(db.String(20))  # 'foil' or 'non-foil' for MTG/Pokemon
-    image_front = db.Column(db.String(500))  # Path to front scan
-    image_back = db.Column(db.String(500))  # Path to back scan
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    listing = db.relationship('Listing', backref='card', uselist=False)
+class CardTitleMixin:
+    """
+    Title/condition formatting shared by Card and the lightweight CardRow
+    used by the list views (see read_models.py).
+    """
+    __slots__ = ()
 
     def condition_display(self):
         """Return properly formatted condition string."""
@@ -79,6 +62,34 @@ class Card(db.Model):
 
         return " ".join(parts)
 
+
+class Card(CardTitleMixin, db.Model):
+    __tablename__ = 'cards'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    card_type = db.Column(db.String(20), nullable=False)  # 'sports', 'mtg', 'pokemon'
+    name = db.Column(db.String(200))  # Additional details - optional
+    set_name = db.Column(db.String(100))  # Set or year
+    card_number = db.Column(db.String(50))  # Card number in set
+    player_name = db.Column(db.String(100))  # For sports cards
+    year = db.Column(db.String(10))  # For sports cards
+    condition = db.Column(db.String(20), nullable=False)  # NM, LP, PSA 9, etc.
+    is_graded = db.Column(db.Boolean, default=False)
+    grading_company = db.Column(db.String(20))  # PSA, BGS, SGC
+    grade = db.Column(db.String(10))  # 9, 9.5, 10, etc.
+    quantity = db.Column(db.Integer, default=1)  # 1x, 2x, 3x, 4x
+    starting_bid = db.Column(db.Float, default=0.50)
+    notes = db.Column(db.Text)  # Public notes - shown in auction description
+    private_notes = db.Column(db.Text)  # Private notes - internal use only
+    foil = db.Column(db.String(20))  # 'foil' or 'non-foil' for MTG/Pokemon
+    image_front = db.Column(db.String(500))  # Path to front scan
+    image_back = db.Column(db.String(500))  # Path to back scan
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    listing = db.relationship('Listing', backref='card', uselist=False)
+
     # Shipping options available to buyers
     SHIPPING_OPTIONS = [
         {
@@ -203,7 +214,7 @@ class Listing(db.Model):
     ebay_fees = db.Column(db.Float)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     order = db.relationship('Order', backref='listing', uselist=False)
 
@@ -232,4 +243,98 @@ class Order(db.Model):
     shipped_at = db.Column(db.DateTime)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class StoredFile(db.Model):
+    """An uploaded scan in the content-addressed store (see storage.py)."""
+    __tablename__ = 'stored_files'
+    # Orphan cleanup looks up refcount == 0 older than a cutoff
+    __table_args__ = (db.Index('ix_stored_files_orphans', 'refcount', 'created_at'),)
+
+    sha256 = db.Column(db.String(64), primary_key=True)  # Hash of the uploaded bytes
+    path = db.Column(db.String(500), nullable=False, unique=True)  # Relative to uploads, e.g. 'ab/cd/<sha>.jpg'
+    size = db.Column(db.Integer)
+    refcount = db.Column(db.Integer, nullable=False, default=0)  # Card image columns pointing here
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Bumped when the same bytes are uploaded again
+
+
+class GradingBatch(db.Model):
+    """A Message Batch of condition checks submitted by grade_batch.py."""
+    __tablename__ = 'grading_batches'
+
+    id = db.Column(db.String(100), primary_key=True)  # Batch id from the API
+    status = db.Column(db.String(20), default='in_progress', index=True)
+    # Statuses: in_progress, ended (results not yet written back), collected
+
+    request_count = db.Column(db.Integer, default=0)
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ended_at = db.Column(db.DateTime)
+    collected_at = db.Column(db.DateTime)
+
+    requests = db.relationship('GradingRequest', backref='batch')
+
+
+class GradingRequest(db.Model):
+    """One card side submitted for grading, and the assessment that came back."""
+    __tablename__ = 'grading_requests'
+    __table_args__ = (db.Index('ix_grading_requests_card_side', 'card_id', 'side'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(100), db.ForeignKey('grading_batches.id'), index=True)  # Set once created
+    card_id = db.Column(db.Integer, db.ForeignKey('cards.id'), nullable=False)
+    side = db.Column(db.String(10), nullable=False)  # 'front' or 'back'
+    image = db.Column(db.String(500))  # Image path that was graded
+    submission = db.Column(db.String(32))  # Shared by the requests sent in one batches.create call
+    queued_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    status = db.Column(db.String(20), default='pending')
+    # Statuses: submitting (recorded before the batch is created), pending,
+    # succeeded, errored, canceled, expired
+
+    assessment = db.Column(db.Text)
+    error = db.Column(db.Text)
+    input_tokens = db.Column(db.Integer)
+    output_tokens = db.Column(db.Integer)
+    completed_at = db.Column(db.DateTime)
+
+    card = db.relationship('Card', backref=db.backref('grading_requests', cascade='all, delete-orphan'))
+
+    def custom_id(self):
+        """Id used to match this request to its batch result."""
+        return f"card-{self.card_id}-{self.side}-{self.submission}"
+
+
+class ConditionResult(db.Model):
+    """
+    Structured condition assessment of one card side (see condition_results.py).
+    Rows from the upload-time check are linked to their card when it is saved.
+    """
+    __tablename__ = 'condition_results'
+    __table_args__ = (
+        db.Index('ix_condition_results_card_side', 'card_id', 'side'),
+        db.Index('ix_condition_results_image_side', 'image', 'side'),
+        db.Index('ix_condition_results_grade_gap', 'grade_gap'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    card_id = db.Column(db.Integer, db.ForeignKey('cards.id'))  # None until the card is saved
+    side = db.Column(db.String(10), nullable=False)  # 'front' or 'back'
+    image = db.Column(db.String(500), nullable=False)  # Image path that was graded
+    source = db.Column(db.String(10), default='check')  # check or batch
+
+    corners = db.Column(db.String(500))
+    edges = db.Column(db.String(500))
+    surface = db.Column(db.String(500))
+    centering = db.Column(db.String(10))  # e.g. 55/45
+    centering_worst = db.Column(db.Integer)  # Larger side of the split, e.g. 55
+    estimated_grade = db.Column(db.String(10), nullable=False)  # NM, LP, EX, etc.
+    grade_rank = db.Column(db.Integer, nullable=False)  # Higher is better
+    notes = db.Column(db.Text)
+
+    # Seller's selected grade rank minus grade_rank; > 0 means the model
+    # graded the card below what the seller picked. None for slabbed cards.
+    grade_gap = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    card = db.relationship('Card', backref=db.backref('condition_results', cascade='all, delete-orphan'))
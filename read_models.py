@@ -0,0 +1,174 @@
+"""
+Read model for the dashboard, report and cards pages.
+
+The list views only need a handful of columns, so instead of loading full
+Card/Listing/Order objects (including Text columns like notes) this module
+selects just those columns in one joined query and keeps the results in
+compact __slots__ rows. Results are cached per process and tenant, keyed on
+a change token (row counts and max(updated_at) of cards, listings and
+orders, one aggregate query), so a write made by another worker process is
+seen on the next request. Entries are also dropped whenever a session
+commits changes.
+"""
+
+import threading
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+import invalidation
+import tenants
+from models import db, Card, CardTitleMixin, Listing, Order
+
+# Statuses shown on the dashboard/report, and the ones counted on the dashboard
+LIST_STATUSES = ('draft', 'listed', 'ended_sold', 'paid', 'shipped')
+COUNTED_STATUSES = ('draft', 'scheduled', 'listed', 'ended_sold', 'paid', 'shipped')
+DASHBOARD_STATUSES = ('draft', 'listed', 'ended_sold', 'paid')  # Statuses with a dashboard table
+
+OrderRow = namedtuple('OrderRow', ['buyer_username', 'paid_at', 'shipped_at', 'tracking_number'])
+ListingRef = namedtuple('ListingRef', ['id', 'status'])
+
+
+class CardRow(CardTitleMixin):
+    """The Card columns the list views render, plus title()/condition_display()."""
+    __slots__ = ('id', 'card_type', 'name', 'set_name', 'card_number', 'player_name', 'year',
+                 'condition', 'is_graded', 'grading_company', 'grade', 'quantity', 'starting_bid',
+                 'listing')
+
+    def __init__(self, id, card_type, name, set_name, card_number, player_name, year, condition,
+                 is_graded, grading_company, grade, quantity, starting_bid, listing=None):
+        self.id = id
+        self.card_type = card_type
+        self.name = name
+        self.set_name = set_name
+        self.card_number = card_number
+        self.player_name = player_name
+        self.year = year
+        self.condition = condition
+        self.is_graded = is_graded
+        self.grading_company = grading_company
+        self.grade = grade
+        self.quantity = quantity
+        self.starting_bid = starting_bid
+        self.listing = listing
+
+
+class ListingRow:
+    """The Listing columns the list views render, with its card and order."""
+    __slots__ = ('id', 'status', 'scheduled_end_time', 'actual_end_time', 'current_bid',
+                 'winning_bid', 'card', 'order')
+
+    def __init__(self, id, status, scheduled_end_time, actual_end_time, current_bid, winning_bid,
+                 card, order):
+        self.id = id
+        self.status = status
+        self.scheduled_end_time = scheduled_end_time
+        self.actual_end_time = actual_end_time
+        self.current_bid = current_bid
+        self.winning_bid = winning_bid
+        self.card = card
+        self.order = order
+
+
+CARD_COLUMNS = (Card.id, Card.card_type, Card.name, Card.set_name, Card.card_number,
+                Card.player_name, Card.year, Card.condition, Card.is_graded,
+                Card.grading_company, Card.grade, Card.quantity, Card.starting_bid)
+LISTING_COLUMNS = (Listing.id, Listing.status, Listing.scheduled_end_time, Listing.actual_end_time,
+                   Listing.current_bid, Listing.winning_bid)
+ORDER_COLUMNS = (Order.id, Order.buyer_username, Order.paid_at, Order.shipped_at,
+                 Order.tracking_number)
+
+
+# --- Cache ---
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _change_token():
+    return tuple(db.session.execute(select(
+        select(func.count(Card.id)).scalar_subquery(),
+        select(func.max(Card.updated_at)).scalar_subquery(),
+        select(func.count(Listing.id)).scalar_subquery(),
+        select(func.max(Listing.updated_at)).scalar_subquery(),
+        select(func.count(Order.id)).scalar_subquery(),
+        select(func.max(Order.updated_at)).scalar_subquery(),
+    )).one())
+
+
+def _cached(name, loader):
+    key = (tenants.current().name, name)
+    # Read before loading: a write in between only makes the entry reload early
+    token = _change_token()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == token:
+            return entry[1]
+    value = loader()
+    with _cache_lock:
+        _cache[key] = (token, value)
+    return value
+
+
+@invalidation.on_commit
+def invalidate():
+    """Drop every cached read model."""
+    with _cache_lock:
+        _cache.clear()
+
+
+# --- Loaders ---
+
+def _load_listings_by_status():
+    n_listing, n_card = len(LISTING_COLUMNS), len(CARD_COLUMNS)
+    stmt = (
+        select(*LISTING_COLUMNS, *CARD_COLUMNS, *ORDER_COLUMNS)
+        .join(Card, Listing.card_id == Card.id)
+        .outerjoin(Order, Order.listing_id == Listing.id)
+        .where(Listing.status.in_(LIST_STATUSES))
+        .order_by(Listing.id)
+    )
+    by_status = {status: [] for status in LIST_STATUSES}
+    for row in db.session.execute(stmt):
+        card = CardRow(*row[n_listing:n_listing + n_card])
+        order_values = row[n_listing + n_card:]
+        order = OrderRow(*order_values[1:]) if order_values[0] is not None else None
+        by_status[row[1]].append(ListingRow(*row[:n_listing], card, order))
+    return by_status
+
+
+def _load_status_counts():
+    stmt = select(Listing.status, func.count()).group_by(Listing.status)
+    counts = {status: 0 for status in COUNTED_STATUSES}
+    for status, count in db.session.execute(stmt):
+        if status in counts:
+            counts[status] = count
+    return counts
+
+
+def _load_cards():
+    stmt = (
+        select(*CARD_COLUMNS, Listing.id, Listing.status)
+        .outerjoin(Listing, Listing.card_id == Card.id)
+        .order_by(Card.created_at.desc())
+    )
+    cards = []
+    for row in db.session.execute(stmt):
+        listing = ListingRef(row[-2], row[-1]) if row[-2] is not None else None
+        cards.append(CardRow(*row[:-2], listing=listing))
+    return cards
+
+
+def listings_by_status():
+    """Dict of status -> [ListingRow] for the dashboard/report statuses."""
+    return _cached('listings_by_status', _load_listings_by_status)
+
+
+def status_counts():
+    """Dict of status -> listing count for the dashboard."""
+    return _cached('status_counts', _load_status_counts)
+
+
+def card_rows():
+    """All cards, newest first, each with a ListingRef (or None)."""
+    return _cached('cards', _load_cards)
@@ -0,0 +1,174 @@
+"""
+Render cache and conditional GETs for the dashboard and listing previews.
+
+Each page has a cheap change token: max(updated_at) and row counts of the
+rows it renders (one aggregate query), plus the tenant's settings version.
+The token becomes the page's ETag, and rendered HTML is kept in a bounded
+LRU keyed by it, so a repeat view costs one small query: a 304 if the
+browser already has the page, otherwise the cached HTML.
+
+Entries are dropped whenever a session commits changes or settings are
+saved. Writes made by another process change the token instead, since the
+routes that edit a card also bump its listing's updated_at.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import func, select
+
+import invalidation
+import metrics
+import tenants
+from models import db, Listing, Order
+
+RENDER_CACHE_ENTRIES = 256
+RENDER_CACHE_BYTES = 32 * 1024 * 1024  # Rendered HTML kept across all pages and tenants
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered HTML, bounded by entry count and size."""
+
+    def __init__(self, max_entries=RENDER_CACHE_ENTRIES, max_bytes=RENDER_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def put(self, key, html):
+        if len(html) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = html
+            self.size += len(html)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = RenderCache()
+_last_write = None  # When this process last committed a change (Last-Modified after deletes)
+
+
+@invalidation.on_commit
+def invalidate():
+    """Drop every cached page."""
+    global _last_write
+    _cache.clear()
+    _last_write = datetime.now(timezone.utc)
+
+
+# --- Change tokens ---
+
+def _utc(value):
+    return value.replace(tzinfo=timezone.utc) if value is not None else None
+
+
+def _settings_version():
+    version = tenants.current().settings_version
+    modified = datetime.fromtimestamp(version / 1e9, timezone.utc) if version else None
+    return version, modified
+
+
+def dashboard_version():
+    """(token, last_modified) for pages built from every listing and order."""
+    row = db.session.execute(select(
+        select(func.max(Listing.updated_at)).scalar_subquery(),
+        select(func.count(Listing.id)).scalar_subquery(),
+        select(func.max(Order.updated_at)).scalar_subquery(),
+        select(func.count(Order.id)).scalar_subquery(),
+    )).one()
+    settings_version, settings_modified = _settings_version()
+    token = (*(value.isoformat() if isinstance(value, datetime) else value for value in row),
+             settings_version)
+    return token, _latest(_utc(row[0]), _utc(row[2]), settings_modified)
+
+
+def listing_version(listing_id):
+    """(token, last_modified) for one listing's pages, or None if it doesn't exist."""
+    row = db.session.execute(
+        select(Listing.updated_at, Order.updated_at)
+        .outerjoin(Order, Order.listing_id == Listing.id)
+        .where(Listing.id == listing_id)
+    ).first()
+    if row is None:
+        return None
+    settings_version, settings_modified = _settings_version()
+    token = (listing_id, *(value.isoformat() if value else None for value in row), settings_version)
+    return token, _latest(_utc(row[0]), _utc(row[1]), settings_modified)
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+# --- Serving ---
+
+def _not_modified(etag, last_modified):
+    # The ETag is authoritative; If-Modified-Since only applies without one
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified.replace(microsecond=0) <= since
+
+
+def etag(page, token):
+    """ETag of a page of the current tenant with the given change token."""
+    return hashlib.sha1(repr((tenants.current().name, page, token)).encode()).hexdigest()
+
+
+def cached_page(page, token, last_modified, render):
+    """
+    Response for a GET of `page`, whose content is identified by `token`.
+    render() is only called when neither the browser nor the LRU has it.
+    Pages carrying flashed messages are rendered and never cached.
+    """
+    if session.get('_flashes') or not current_app.config.get('RENDER_CACHE', True):
+        return make_response(render())
+
+    tenant = tenants.current().name
+    page_etag = etag(page, token)
+    last_modified = _latest(last_modified, _last_write)
+
+    if _not_modified(page_etag, last_modified):
+        metrics.RENDER_CACHE.inc(page, 'not_modified')
+        response = make_response('', 304)
+    else:
+        key = (tenant, page, page_etag)
+        html = _cache.get(key)
+        if html is None:
+            metrics.RENDER_CACHE.inc(page, 'miss')
+            html = render()
+            _cache.put(key, html)
+        else:
+            metrics.RENDER_CACHE.inc(page, 'hit')
+        response = make_response(html)
+
+    response.set_etag(page_etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Revalidate on every view
+    response.cache_control.private = True
+    return response
@@ -0,0 +1,57 @@
+"""
+Serve the app for everyday use, with live dashboard updates.
+
+Each open dashboard keeps an /events stream connected, so the server has
+to hold many idle connections cheaply. With gevent installed every request
+runs in a greenlet, and hundreds of idle streams cost a few KB each.
+Without it, this falls back to Werkzeug's threaded server (one thread per
+open stream), which is fine for a handful of browser tabs.
+
+Live updates (LIVE_EVENTS) are only turned on here: under a sync-worker
+server such as gunicorn each open stream would hold a worker. They are
+published in-process (see events.py), so run one server process, not
+several workers:
+
+    python serve.py                  # http://127.0.0.1:8000
+    python serve.py --host 0.0.0.0 --port 8080
+
+Run `flask --app app init-db` first to create the database.
+"""
+
+try:
+    from gevent import monkey
+    monkey.patch_all()  # Before anything imports socket/threading
+except ImportError:  # gevent is optional
+    monkey = None
+
+import os
+import sys
+
+# Add the app directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import create_app
+
+
+def serve(app, host='127.0.0.1', port=8000):
+    if monkey is not None:
+        from gevent.pywsgi import WSGIServer
+
+        print(f"Serving on http://{host}:{port} (gevent)", flush=True)
+        WSGIServer((host, port), app, log=None).serve_forever()
+    else:
+        from werkzeug.serving import run_simple
+
+        print(f"Serving on http://{host}:{port} (threaded; install gevent for many live dashboards)", flush=True)
+        run_simple(host, port, app, threaded=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the app with live dashboard updates')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port (default: 8000)')
+
+    args = parser.parse_args()
+    serve(create_app({'LIVE_EVENTS': True}), host=args.host, port=args.port)
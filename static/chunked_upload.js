@@ -0,0 +1,85 @@
+// Resumable chunked upload for large scans (see chunked_upload.py).
+// Files larger than CHUNKED_UPLOAD_THRESHOLD are sent in chunks; if the
+// connection drops, uploading the same file again resumes where it stopped.
+
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+
+async function sha256Base64(buffer) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;  // Checksums need a secure context (https or localhost)
+    }
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    let binary = '';
+    new Uint8Array(digest).forEach(b => binary += String.fromCharCode(b));
+    return btoa(binary);
+}
+
+async function uploadChunked(file, side, onProgress) {
+    const resumeKey = `chunked-upload:${side}:${file.name}:${file.size}:${file.lastModified}`;
+    let uploadId = localStorage.getItem(resumeKey);
+    let offset = 0;
+    let chunkSize = 4 * 1024 * 1024;
+    let checksumRetries = 0;
+
+    if (uploadId) {
+        const status = await fetch(`/api/upload-image/chunked/${uploadId}`);
+        if (status.ok) {
+            offset = (await status.json()).offset;
+        } else {
+            uploadId = null;
+        }
+    }
+
+    if (!uploadId) {
+        const created = await fetch('/api/upload-image/chunked', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, side: side, length: file.size})
+        });
+        const result = await created.json();
+        if (!created.ok) {
+            return result;
+        }
+        uploadId = result.upload_id;
+        chunkSize = result.chunk_size;
+        localStorage.setItem(resumeKey, uploadId);
+    }
+
+    while (true) {
+        const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+        const headers = {
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': String(offset)
+        };
+        const checksum = await sha256Base64(chunk);
+        if (checksum) {
+            headers['Upload-Checksum'] = `sha256 ${checksum}`;
+        }
+
+        const response = await fetch(`/api/upload-image/chunked/${uploadId}`, {
+            method: 'PATCH',
+            headers: headers,
+            body: chunk
+        });
+        const result = await response.json();
+
+        if (response.status === 460 && checksumRetries++ < 3) {
+            continue;  // Chunk corrupted in transit, send it again
+        }
+        if (!response.ok) {
+            if (response.status === 404) {
+                localStorage.removeItem(resumeKey);
+            }
+            return result;
+        }
+
+        offset = result.offset;
+        if (onProgress) {
+            onProgress(offset, file.size);
+        }
+        if (result.success) {
+            localStorage.removeItem(resumeKey);
+            return result;
+        }
+    }
+}
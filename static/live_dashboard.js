@@ -0,0 +1,94 @@
+// Live dashboard updates over server-sent events (see events.py).
+// Listing events carry the re-rendered row and the status counts, so the
+// page patches itself; if it missed events (reconnect, or the server
+// dropped a slow client's backlog) it reloads instead.
+
+const ACTIVITY_LIMIT = 20;
+
+function dashboardSection(status) {
+    return document.querySelector(`section[data-status="${status}"]`);
+}
+
+function refreshSection(section) {
+    const rows = section.querySelectorAll('tbody tr').length;
+    section.querySelector('.section-count').textContent = rows;
+    section.hidden = rows === 0;
+}
+
+function applyListing(data) {
+    const existing = document.querySelector(`tr[data-listing-id="${data.listing_id}"]`);
+    if (existing) {
+        const section = existing.closest('section');
+        existing.remove();
+        refreshSection(section);
+    }
+
+    const section = data.row && dashboardSection(data.status);
+    if (section) {
+        const template = document.createElement('template');
+        template.innerHTML = data.row.trim();
+        const row = template.content.firstElementChild;
+        const tbody = section.querySelector('tbody');
+        // Rows are ordered by listing id, like the server render
+        const next = Array.from(tbody.rows).find(r => Number(r.dataset.listingId) > data.listing_id);
+        tbody.insertBefore(row, next || null);
+        refreshSection(section);
+    }
+
+    for (const [status, count] of Object.entries(data.counts)) {
+        const counter = document.querySelector(`.status-card.${status} .count`);
+        if (counter) {
+            counter.textContent = count;
+        }
+    }
+}
+
+function addActivity(text) {
+    const section = document.getElementById('live-activity');
+    const list = section.querySelector('ul');
+    const item = document.createElement('li');
+    item.textContent = `${new Date().toLocaleTimeString()}  ${text}`;
+    list.insertBefore(item, list.firstChild);
+    while (list.children.length > ACTIVITY_LIMIT) {
+        list.removeChild(list.lastChild);
+    }
+    section.hidden = false;
+}
+
+function connectDashboard() {
+    const dashboard = document.getElementById('dashboard');
+    // data-events is only set when the server can hold streams (serve.py)
+    if (!dashboard || !dashboard.dataset.events || !window.EventSource) {
+        return;
+    }
+    const source = new EventSource(dashboard.dataset.events);
+
+    // Sent on every (re)connect: reload if the page is older than the data
+    source.addEventListener('hello', event => {
+        if (JSON.parse(event.data).dashboard !== dashboard.dataset.etag) {
+            location.reload();
+        }
+    });
+    source.addEventListener('resync', () => location.reload());
+
+    source.addEventListener('listing', event => {
+        const data = JSON.parse(event.data);
+        applyListing(data);
+        dashboard.dataset.etag = data.dashboard;
+    });
+    source.addEventListener('upload', event => {
+        const data = JSON.parse(event.data);
+        const corrections = data.corrections.length ? ` (${data.corrections.join(', ')})` : '';
+        addActivity(`Scan uploaded${corrections}`);
+    });
+    source.addEventListener('condition', event => {
+        const data = JSON.parse(event.data);
+        addActivity(`Condition check: ${data.side} graded ${data.estimated_grade}`);
+    });
+    source.addEventListener('grading', event => {
+        const data = JSON.parse(event.data);
+        addActivity(`Batch grading collected: ${data.succeeded} graded, ${data.errored} failed`);
+    });
+}
+
+connectDashboard();
@@ -0,0 +1,150 @@
+"""
+Content-addressed storage for uploaded scans.
+
+Files are named by the SHA-256 of the uploaded bytes and sharded into
+subdirectories (uploads/ab/cd/<sha>.<ext>), so uploading the same scan twice
+stores it once and concurrent uploads can never overwrite each other.
+
+Each stored file has a StoredFile row whose refcount is the number of Card
+image columns pointing at it. Unreferenced files are found with an indexed
+query instead of scanning the upload folder.
+"""
+
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+import condition_results
+from models import db, StoredFile
+
+INCOMING_DIR = '.incoming'
+READ_BUFFER = 64 * 1024
+
+
+def incoming_path(upload_folder, ext):
+    """A unique temporary path inside the upload folder for a new upload."""
+    folder = os.path.join(upload_folder, INCOMING_DIR)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{uuid.uuid4().hex}.{ext}")
+
+
+def file_sha256(path):
+    """Hash a file in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shard_path(sha256, ext):
+    """Relative storage path for a hash, e.g. 'ab/cd/abcd...ef.jpg'."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def store_file(upload_folder, src_path, ext, process=None):
+    """
+    Move a freshly uploaded file into the store and return its StoredFile.
+
+    If the same bytes were stored before, the new copy is discarded and the
+    existing (already processed) file is returned. Otherwise
+    `process(path)` (e.g. the auto-crop) runs once on it and the file is
+    renamed into place; if processing raises, the file is deleted.
+    """
+    sha256 = file_sha256(src_path)
+    stored = db.session.get(StoredFile, sha256)
+    if stored is not None and os.path.exists(os.path.join(upload_folder, stored.path)):
+        os.remove(src_path)
+        # Restart the orphan grace period: the re-upload's card isn't saved yet
+        stored.created_at = datetime.utcnow()
+        db.session.commit()
+        return stored
+
+    rel_path = shard_path(sha256, ext.lower())
+    abs_path = os.path.join(upload_folder, rel_path)
+    size = os.path.getsize(src_path)
+
+    if process is not None:
+        # Process under .incoming (with the real extension, which the image
+        # writers go by) so a failure never leaves a file in the store
+        staged = incoming_path(upload_folder, ext.lower())
+        os.replace(src_path, staged)
+        try:
+            process(staged)
+        except BaseException:
+            os.remove(staged)
+            raise
+        src_path = staged
+
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    os.replace(src_path, abs_path)
+
+    if stored is not None:
+        # Row survived but the file was removed by hand; it has been restored
+        stored.created_at = datetime.utcnow()
+        db.session.commit()
+        return stored
+
+    stored = StoredFile(sha256=sha256, path=rel_path, size=size, refcount=0)
+    db.session.add(stored)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same scan was stored concurrently; both copies are identical
+        db.session.rollback()
+        stored = db.session.get(StoredFile, sha256)
+    return stored
+
+
+def _adjust(path, delta):
+    if path:
+        db.session.execute(
+            update(StoredFile)
+            .where(StoredFile.path == path)
+            .values(refcount=StoredFile.refcount + delta)
+        )
+
+
+def add_reference(path):
+    """Record that a card image column now points at `path`."""
+    _adjust(path, 1)
+
+
+def release_reference(path):
+    """Record that a card image column no longer points at `path`."""
+    _adjust(path, -1)
+
+
+def replace_reference(old_path, new_path):
+    """Move a card image column from old_path to new_path."""
+    if old_path != new_path:
+        release_reference(old_path)
+        add_reference(new_path)
+
+
+def unreferenced_files(grace_hours=24):
+    """
+    Stored files no card points at, last uploaded before the grace period
+    (uploads waiting for their Add Card form to be submitted are left alone).
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    return StoredFile.query.filter(
+        StoredFile.refcount == 0,
+        StoredFile.created_at < cutoff
+    ).all()
+
+
+def delete_stored_file(upload_folder, stored):
+    """
+    Remove a stored file from disk and the store, with any condition results
+    of it that were never linked to a card (caller commits).
+    """
+    filepath = os.path.join(upload_folder, stored.path)
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    condition_results.delete_unlinked(stored.path)
+    db.session.delete(stored)
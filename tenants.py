@@ -0,0 +1,262 @@
+"""
+Tenant routing: one process serving several seller stores.
+
+Each tenant has its own database, upload folder and settings file, listed in
+tenants.json (or the file named by TENANTS_FILE):
+
+    {
+        "default": "main",
+        "tenants": {
+            "main": {"hosts": ["cards.example.com"],
+                     "database_url": "sqlite:////srv/cards/main.db",
+                     "upload_folder": "/srv/cards/main/uploads",
+                     "settings_file": "/srv/cards/main/settings.json"},
+            "second": {"hosts": ["second.example.com"], ...}
+        }
+    }
+
+Requests are routed by Host header (unknown hosts go to the default tenant,
+or get a 404 if there is none). TenantSession binds the request's session
+to the tenant's engine. Engines, and their connection pools, are created on
+first use and disposed after TENANT_IDLE_SECONDS without requests.
+
+Without a tenants file the app serves one tenant built from DATABASE_URL,
+UPLOAD_FOLDER and settings.json, exactly as before.
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import abort, current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, inspect, text
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TENANTS_FILE = os.path.join(BASE_DIR, 'tenants.json')
+SETTINGS_FILE = os.path.join(BASE_DIR, 'settings.json')
+
+DEFAULT_TENANT = 'default'
+TENANT_POOL_SIZE = 5
+TENANT_MAX_OVERFLOW = 5
+TENANT_IDLE_SECONDS = 600  # Dispose a tenant's pool after this long without requests
+EVICT_INTERVAL = 60  # How often requests check for idle tenants
+
+
+class Tenant:
+    """One store: its database engine, upload folder and cached settings."""
+
+    def __init__(self, name, upload_folder, settings_file, database_url=None, hosts=()):
+        self.name = name
+        self.database_url = database_url  # None: use the app's own engine
+        self.upload_folder = upload_folder
+        self.settings_file = settings_file
+        self.hosts = tuple(host.lower() for host in hosts)
+        self.last_used = time.monotonic()
+        self._engine = None
+        self._settings = None  # (mtime_ns, parsed settings)
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        """The tenant's engine, created (with its own pool) on first use."""
+        self.last_used = time.monotonic()
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = create_engine(self.database_url, pool_size=TENANT_POOL_SIZE,
+                                                 max_overflow=TENANT_MAX_OVERFLOW, pool_pre_ping=True)
+        return self._engine
+
+    def dispose(self):
+        """Close pooled connections; the engine is recreated on next use."""
+        with self._lock:
+            engine, self._engine = self._engine, None
+        if engine is not None:
+            engine.dispose()
+
+    def idle_for(self, now):
+        return now - self.last_used if self._engine is not None else 0
+
+    @property
+    def settings_version(self):
+        """Changes whenever the settings file is saved (0 if there is none)."""
+        try:
+            return os.stat(self.settings_file).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def load_settings(self):
+        """
+        Parsed settings, re-read only when the file changes. Returns a copy
+        callers may modify, or None if the tenant has no settings file yet.
+        """
+        version = self.settings_version
+        if not version:
+            return None
+        cached = self._settings
+        if cached is None or cached[0] != version:
+            with open(self.settings_file, 'r') as f:
+                cached = (version, json.load(f))
+            self._settings = cached
+        return copy.deepcopy(cached[1])
+
+    def save_settings(self, settings):
+        tmp_path = self.settings_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(settings, f, indent=4)
+        os.replace(tmp_path, self.settings_file)
+        self._settings = None
+
+
+class TenantRegistry:
+    """The tenants served by one app, looked up by name or host."""
+
+    def __init__(self, tenants, default=None, configured=False):
+        self.tenants = {tenant.name: tenant for tenant in tenants}
+        self.default = default
+        self.configured = configured  # Loaded from a tenants file
+        self.by_host = {host: tenant for tenant in tenants for host in tenant.hosts}
+        self._last_eviction = time.monotonic()
+
+    def get(self, name=None):
+        name = name or self.default
+        if name not in self.tenants:
+            raise KeyError(f'Unknown tenant: {name}')
+        return self.tenants[name]
+
+    def all(self):
+        return list(self.tenants.values())
+
+    def resolve(self, host):
+        """Tenant for a request Host header, or None."""
+        tenant = self.by_host.get(host.split(':', 1)[0].lower())
+        if tenant is None and self.default:
+            tenant = self.tenants[self.default]
+        return tenant
+
+    def evict_idle(self, max_idle=TENANT_IDLE_SECONDS):
+        """Dispose the pools of tenants without requests for max_idle seconds."""
+        now = time.monotonic()
+        self._last_eviction = now
+        evicted = []
+        for tenant in self.all():
+            if tenant.idle_for(now) > max_idle:
+                tenant.dispose()
+                evicted.append(tenant.name)
+        return evicted
+
+    def maybe_evict_idle(self):
+        if time.monotonic() - self._last_eviction > EVICT_INTERVAL:
+            self.evict_idle()
+
+
+def load_registry(app):
+    """Build the registry from the tenants file, or the single-tenant config."""
+    path = app.config.get('TENANTS_FILE') or os.getenv('TENANTS_FILE', TENANTS_FILE)
+    if not os.path.exists(path):
+        tenant = Tenant(DEFAULT_TENANT, app.config['UPLOAD_FOLDER'], SETTINGS_FILE)
+        return TenantRegistry([tenant], default=DEFAULT_TENANT)
+
+    with open(path, 'r') as f:
+        config = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    tenants = [
+        Tenant(
+            name,
+            upload_folder=os.path.join(base, options.get('upload_folder', os.path.join('uploads', name))),
+            settings_file=os.path.join(base, options.get('settings_file', f'settings-{name}.json')),
+            database_url=options.get('database_url', f"sqlite:///{os.path.join(base, name + '.db')}"),
+            hosts=options.get('hosts', ()),
+        )
+        for name, options in config['tenants'].items()
+    ]
+    return TenantRegistry(tenants, default=config.get('default'), configured=True)
+
+
+def check_script_tenant(parser, app, name=None):
+    """Exit with a usage error if a script's --tenant doesn't name a tenant."""
+    tenants = registry(app).tenants
+    if (name or registry(app).default) in tenants:
+        return
+    names = ', '.join(sorted(tenants))
+    if name:
+        parser.error(f"unknown store {name!r} (stores: {names})")
+    parser.error(f"the tenants file has no default store; pass --tenant NAME (stores: {names})")
+
+
+def registry(app=None):
+    return (app or current_app).extensions['tenants']
+
+
+def current():
+    """The tenant of the current request (or use_tenant block), else the default."""
+    tenant = g.get('tenant')
+    if tenant is None:
+        tenant = registry().get()
+    return tenant
+
+
+def upload_folder():
+    """Upload root of the current tenant."""
+    return current().upload_folder
+
+
+@contextmanager
+def use_tenant(app, name=None):
+    """App context bound to one tenant, for scripts and background work."""
+    with app.app_context():
+        g.tenant = registry(app).get(name)
+        yield g.tenant
+
+
+def create_tables(tenant):
+    """
+    Create the schema in a tenant's database (needs an app context). Nullable
+    columns and indexes added to a model since its table was created are
+    added too.
+    """
+    from models import db
+
+    engine = tenant.engine if tenant.database_url else db.engine
+    db.metadata.create_all(engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+class TenantSession(Session):
+    """Flask-SQLAlchemy session that runs queries on the current tenant's engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            tenant = current()
+            if tenant.database_url:
+                return tenant.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_app(app):
+    """Load the tenants and route each request to its tenant."""
+    app.extensions['tenants'] = load_registry(app)
+
+    @app.before_request
+    def bind_tenant():
+        tenant = registry(app).resolve(request.host)
+        if tenant is None:
+            abort(404)
+        g.tenant = tenant
+        tenant.last_used = time.monotonic()
+        registry(app).maybe_evict_idle()